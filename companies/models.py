@@ -1,10 +1,8 @@
 import uuid
-from celery.exceptions import OperationalError
-from redis.exceptions import ConnectionError
-from django.db import models
+from django.db import models, transaction
 from django.utils import timezone
 from datetime import timedelta
-from config.celery import app as celery_app
+from core.outbox import enqueue
 from users.models import User
 
 
@@ -43,16 +41,16 @@ class CompanyMembership(models.Model):
 
     def save(self, *args, **kwargs):
         is_new = self._state.adding
-        super().save(*args, **kwargs)
-        if is_new:
-            from companies.tasks import create_notification_for_new_member
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if is_new:
+                from companies.tasks import create_notification_for_new_member
 
-            conn = celery_app.connection()
-            try:
-                conn.connect()
-                create_notification_for_new_member.delay(self.company_id, self.id)
-            except (OperationalError, ConnectionError):
-                create_notification_for_new_member(self.company_id, self.id)
+                # 브로커 상태와 무관하게 가입과 같은 트랜잭션에서 아웃박스에 기록
+                enqueue(
+                    create_notification_for_new_member,
+                    args=(self.company_id, self.id),
+                )
 
     class Meta:
         indexes = [
@@ -114,6 +112,14 @@ class Notification(models.Model):
         indexes = [
             models.Index(fields=["recipient", "is_read"]),
             models.Index(fields=["created_at"]),
+            # 알림함 커서 페이지네이션용
+            models.Index(fields=["recipient", "-created_at", "-id"]),
+            # 오래된 읽은 알림 정리용
+            models.Index(
+                fields=["created_at"],
+                condition=models.Q(is_read=True),
+                name="notification_read_created_idx",
+            ),
         ]
         ordering = ["-created_at"]
 
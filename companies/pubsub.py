@@ -0,0 +1,170 @@
+import asyncio
+import json
+import logging
+from collections import defaultdict
+import redis
+import redis.asyncio as aioredis
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+_backend = None
+
+
+def notification_channel(user_id):
+    return f"notifications:{user_id}"
+
+
+class Subscription:
+    """한 SSE 연결의 구독. 프로세스가 받은 메시지를 큐로 전달받음"""
+
+    def __init__(self, pubsub, channel):
+        self.pubsub = pubsub
+        self.channel = channel
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue()
+
+    async def get(self, timeout):
+        """다음 메시지를 기다리고, timeout 안에 없으면 None"""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    async def close(self):
+        await self.pubsub.unsubscribe(self)
+
+
+class InMemoryPubSub:
+    """한 프로세스 안에서만 전달되는 pub/sub (테스트, 로컬 개발용)"""
+
+    def __init__(self):
+        self.subscribers = defaultdict(set)
+
+    def publish_many(self, messages):
+        for channel, message in messages:
+            for subscription in list(self.subscribers.get(channel, ())):
+                # 발행은 다른 스레드(작업, 요청)에서 일어날 수 있음
+                subscription.loop.call_soon_threadsafe(
+                    subscription.queue.put_nowait, message
+                )
+
+    async def subscribe(self, channel):
+        subscription = Subscription(self, channel)
+        self.subscribers[channel].add(subscription)
+        return subscription
+
+    async def unsubscribe(self, subscription):
+        self.subscribers[subscription.channel].discard(subscription)
+
+
+class RedisPubSub:
+    """
+    Redis PUBLISH/SUBSCRIBE 기반. 웹/워커 프로세스 간에 전달합니다.
+    구독은 프로세스(이벤트 루프)당 연결 하나를 함께 쓰고, 받은 메시지를 채널의
+    구독자들에게 나눠 줍니다. 채널은 첫 구독자가 생길 때 SUBSCRIBE, 마지막 구독자가
+    떠날 때 UNSUBSCRIBE 합니다.
+    """
+
+    def __init__(self, url):
+        self.url = url
+        self.client = redis.Redis.from_url(url)
+        self.subscribers = defaultdict(set)
+        self._loop = None
+
+    def publish_many(self, messages):
+        pipeline = self.client.pipeline(transaction=False)
+        for channel, message in messages:
+            pipeline.publish(channel, message)
+        pipeline.execute()
+
+    def _ensure_connection(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is loop:
+            return
+        # 연결은 만든 이벤트 루프에서만 쓸 수 있음 (uvicorn 워커는 프로세스당 루프 하나)
+        self._loop = loop
+        self._pubsub = aioredis.Redis.from_url(self.url).pubsub()
+        self._lock = asyncio.Lock()
+        self._reader = None
+        self.subscribers = defaultdict(set)
+
+    async def _read_messages(self):
+        while True:
+            try:
+                message = await self._pubsub.get_message(
+                    ignore_subscribe_messages=True, timeout=None
+                )
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # 연결이 끊기면 다음 읽기에서 다시 접속하고 채널을 다시 구독함
+                logger.error(f"Notification pubsub read failed: {str(e)}")
+                await asyncio.sleep(1)
+                continue
+            if message is None:
+                continue
+            channel = message["channel"].decode()
+            data = message["data"].decode()
+            for subscription in list(self.subscribers.get(channel, ())):
+                subscription.queue.put_nowait(data)
+
+    async def subscribe(self, channel):
+        self._ensure_connection()
+        subscription = Subscription(self, channel)
+        async with self._lock:
+            if not self.subscribers[channel]:
+                await self._pubsub.subscribe(channel)
+            self.subscribers[channel].add(subscription)
+            if self._reader is None or self._reader.done():
+                self._reader = self._loop.create_task(self._read_messages())
+        return subscription
+
+    async def unsubscribe(self, subscription):
+        if subscription.loop is not self._loop:
+            return
+        async with self._lock:
+            subscribers = self.subscribers[subscription.channel]
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self.subscribers[subscription.channel]
+                try:
+                    await self._pubsub.unsubscribe(subscription.channel)
+                except Exception as e:
+                    logger.error(
+                        f"Failed to unsubscribe {subscription.channel}: {str(e)}"
+                    )
+
+
+def get_pubsub():
+    global _backend
+    if _backend is None:
+        config = settings.NOTIFICATION_PUBSUB
+        _backend = import_string(config["BACKEND"])(**config.get("OPTIONS", {}))
+    return _backend
+
+
+def reset_pubsub():
+    """설정을 바꾼 뒤 백엔드를 다시 만들도록 캐시를 비움 (테스트용)"""
+    global _backend
+    _backend = None
+
+
+def publish_notifications(notifications):
+    """생성된 알림을 수신자별 채널로 발행. 실패해도 알림 생성은 유지"""
+    from companies.serializers import NotificationSerializer
+
+    messages = [
+        (
+            notification_channel(notification.recipient_id),
+            json.dumps(NotificationSerializer(notification).data, ensure_ascii=False),
+        )
+        for notification in notifications
+    ]
+    if not messages:
+        return
+    try:
+        get_pubsub().publish_many(messages)
+    except Exception as e:
+        logger.error(f"Failed to publish {len(messages)} notifications: {str(e)}")
@@ -18,3 +18,15 @@ class NotificationSerializer(serializers.ModelSerializer):
     class Meta:
         model = Notification
         fields = ["id", "message", "target_url", "is_read", "created_at"]
+
+
+class NotificationBulkMarkReadSerializer(serializers.Serializer):
+    ids = serializers.ListField(
+        child=serializers.IntegerField(), required=False, max_length=1000
+    )
+    before = serializers.DateTimeField(required=False)
+
+    def validate(self, data):
+        if ("ids" in data) == ("before" in data):
+            raise serializers.ValidationError("ids 또는 before 중 하나만 입력해주세요.")
+        return data
@@ -0,0 +1,100 @@
+import secrets
+import redis
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.redis import RedisCache
+from companies.models import Notification
+
+# DB에서 센 뒤 캐시에 넣기 전에 생긴 알림은 캐시에 없는 키라 더해지지 않으므로,
+# 어긋난 값이 오래 남지 않도록 이 시간이 지나면 다시 셈
+UNREAD_COUNT_TIMEOUT = 60
+
+# 안 읽은 수 일괄 증가용 Redis 클라이언트 (캐시와 같은 서버)
+_redis_client = None
+
+
+# 있는 키만 늘려 남은 만료 시간을 유지 (없는 키를 INCRBY로 만들면 만료 없이 남음)
+INCREMENT_EXISTING_SCRIPT = """
+for _, key in ipairs(KEYS) do
+    if redis.call("EXISTS", key) == 1 then
+        redis.call("INCRBY", key, ARGV[1])
+    end
+end
+"""
+
+
+def _unread_count_key(user_id):
+    return f"notifications:unread:{user_id}"
+
+
+def get_unread_count(user_id):
+    """캐시된 안 읽은 알림 수. 캐시에 없으면 (recipient, is_read) 인덱스로 다시 셈"""
+    key = _unread_count_key(user_id)
+    count = cache.get(key)
+    if count is None:
+        count = Notification.objects.filter(recipient_id=user_id, is_read=False).count()
+        # 그 사이 다른 곳에서 만든 값이 있으면 덮어쓰지 않음
+        cache.add(key, count, UNREAD_COUNT_TIMEOUT)
+    return count
+
+
+def get_redis_client():
+    global _redis_client
+    if _redis_client is None:
+        location = settings.CACHES["default"]["LOCATION"]
+        if isinstance(location, str):
+            location = location.split(",")
+        # 첫 번째 주소가 쓰기용 서버
+        _redis_client = redis.Redis.from_url(location[0])
+    return _redis_client
+
+
+def increment_unread_counts(user_ids, amount=1):
+    """수신자들의 캐시된 안 읽은 수를 늘림. 캐시에 없는 수신자는 다음 조회 때 다시 셈"""
+    keys = [_unread_count_key(user_id) for user_id in user_ids]
+    if not keys:
+        return
+    backend = caches["default"]
+    if isinstance(backend, RedisCache):
+        # 수신자가 많아도 Redis 왕복 한 번으로 처리
+        get_redis_client().register_script(INCREMENT_EXISTING_SCRIPT)(
+            keys=[backend.make_and_validate_key(key) for key in keys], args=[amount]
+        )
+        return
+    for key in keys:
+        try:
+            cache.incr(key, amount)
+        except ValueError:
+            pass
+
+
+def decrement_unread_count(user_id, amount=1):
+    key = _unread_count_key(user_id)
+    try:
+        if cache.decr(key, amount) < 0:
+            cache.delete(key)
+    except ValueError:
+        pass
+
+
+def _stream_ticket_key(ticket):
+    return f"notifications:stream-ticket:{ticket}"
+
+
+def issue_stream_ticket(user_id):
+    """알림 스트림 접속에만 쓰는 짧은 수명의 일회용 티켓 발급"""
+    ticket = secrets.token_urlsafe(32)
+    cache.set(
+        _stream_ticket_key(ticket), user_id, settings.NOTIFICATION_STREAM_TICKET_TTL
+    )
+    return ticket
+
+
+def redeem_stream_ticket(ticket):
+    """티켓의 사용자 ID를 반환하고 티켓을 폐기. 만료됐거나 이미 쓴 티켓이면 None"""
+    key = _stream_ticket_key(ticket)
+    user_id = cache.get(key)
+    # 동시에 같은 티켓을 쓰면 먼저 지운 쪽만 통과
+    if user_id is None or not cache.delete(key):
+        return None
+    return user_id
@@ -0,0 +1,75 @@
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_GET
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from users.models import User
+from .pubsub import get_pubsub, notification_channel
+from .services import redeem_stream_ticket
+
+# 프록시가 유휴 연결을 끊지 않도록 보내는 주석 이벤트 간격(초)
+KEEPALIVE_SECONDS = 20
+
+
+async def authenticate(request):
+    """
+    ?ticket= 의 일회용 스트림 티켓 또는 Authorization 헤더의 JWT로 사용자 확인.
+    EventSource는 헤더를 설정할 수 없어 URL에 JWT 대신 티켓을 담습니다.
+    """
+    ticket = request.GET.get("ticket")
+    if ticket:
+        user_id = await sync_to_async(redeem_stream_ticket)(ticket)
+        if user_id is None:
+            return None
+        return await User.objects.filter(id=user_id, is_active=True).afirst()
+
+    header = request.headers.get("Authorization", "")
+    if not header.startswith("Bearer "):
+        return None
+    authentication = JWTAuthentication()
+    try:
+        validated_token = authentication.get_validated_token(header.split(" ", 1)[1])
+        return await sync_to_async(authentication.get_user)(validated_token)
+    except (AuthenticationFailed, InvalidToken):
+        return None
+
+
+async def event_stream(subscription):
+    try:
+        yield "retry: 5000\n\n"
+        while True:
+            message = await subscription.get(timeout=KEEPALIVE_SECONDS)
+            if message is None:
+                yield ": keepalive\n\n"
+            else:
+                yield f"event: notification\ndata: {message}\n\n"
+    finally:
+        await subscription.close()
+
+
+@require_GET
+async def notification_stream(request):
+    """
+    기능 : 새 알림을 Server-Sent Events로 실시간 전달합니다.
+    허용 : 로그인한 사용자 (notifications/stream/ticket/에서 받은 ?ticket= 또는 Bearer 토큰)
+    ASGI(config.asgi, push 프로세스)에서만 제공하며, WSGI(web)로 들어온 요청은 거절합니다.
+    """
+    # WSGI에서는 끝나지 않는 스트림이 동기 워커 하나를 계속 붙잡음
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse(
+            {"detail": "실시간 알림은 push 서버에서만 제공됩니다."}, status=400
+        )
+    user = await authenticate(request)
+    if user is None:
+        return JsonResponse(
+            {"detail": "유효한 스트림 티켓 또는 인증 토큰이 필요합니다."}, status=401
+        )
+
+    subscription = await get_pubsub().subscribe(notification_channel(user.id))
+    response = StreamingHttpResponse(
+        event_stream(subscription), content_type="text/event-stream"
+    )
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
@@ -1,15 +1,77 @@
+import logging
+import time
+from datetime import timedelta
 from celery import shared_task
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Max, Min
+from django.utils import timezone
 from companies.models import Company, Notification, CompanyMembership
-from products.models import Product
+from companies.pubsub import publish_notifications
+from companies.services import increment_unread_counts
+from core.outbox import enqueue
+from products.models import Product, ProductRecord
+
+logger = logging.getLogger(__name__)
+
+# bulk_create 한 번에 쓰는 행 수
+NOTIFICATION_BATCH_SIZE = 500
+# 수신자가 이보다 많으면 나눠서 하위 작업으로 생성
+NOTIFICATION_FANOUT_CHUNK_SIZE = 2000
+# 오래된 알림을 한 번의 DELETE로 지우는 최대 행 수
+NOTIFICATION_PURGE_BATCH_SIZE = 1000
+
+
+def get_admin_and_owner_ids(company_id):
+    return list(
+        CompanyMembership.objects.filter(
+            company_id=company_id, role__in=["admin", "owner"]
+        ).values_list("user_id", flat=True)
+    )
+
+
+def fan_out_notification(company_id, recipient_ids, message, target_url=None):
+    """
+    수신자 전원에게 같은 알림을 일괄 생성 (수신자가 많으면 하위 작업으로 분할).
+    생성했거나 하위 작업에 맡긴 수신자 수를 반환합니다.
+    """
+    if len(recipient_ids) <= NOTIFICATION_FANOUT_CHUNK_SIZE:
+        return create_notifications(company_id, recipient_ids, message, target_url)
+
+    for start in range(0, len(recipient_ids), NOTIFICATION_FANOUT_CHUNK_SIZE):
+        create_notifications.delay(
+            company_id,
+            recipient_ids[start : start + NOTIFICATION_FANOUT_CHUNK_SIZE],
+            message,
+            target_url,
+        )
+    return len(recipient_ids)
+
+
+@shared_task
+def create_notifications(company_id, recipient_ids, message, target_url=None):
+    notifications = Notification.objects.bulk_create(
+        [
+            Notification(
+                recipient_id=recipient_id,
+                company_id=company_id,
+                message=message,
+                target_url=target_url,
+            )
+            for recipient_id in recipient_ids
+        ],
+        batch_size=NOTIFICATION_BATCH_SIZE,
+    )
+    increment_unread_counts(recipient_ids)
+    publish_notifications(notifications)
+    return len(notifications)
 
 
 @shared_task
 def create_notification_for_new_member(company_id, membership_id):
     company = Company.objects.get(id=company_id)
-    membership = CompanyMembership.objects.get(id=membership_id)
-    admins_and_owners = CompanyMembership.objects.filter(
-        company=company, role__in=["admin", "owner"]
-    ).select_related("user")
+    membership = CompanyMembership.objects.select_related("user").get(id=membership_id)
 
     message = (
         f"새로운 직원 {membership.user.username}님이 {company.name}에 가입했습니다."
@@ -18,30 +80,147 @@ def create_notification_for_new_member(company_id, membership_id):
         f"http://127.0.0.1:8000/api/v1/memberships/{membership_id}/"  # 예시 URL
     )
 
-    for membership in admins_and_owners:
-        Notification.objects.create(
-            recipient=membership.user,
-            company=company,
-            message=message,
-            target_url=target_url,
-        )
+    fan_out_notification(
+        company.id, get_admin_and_owner_ids(company.id), message, target_url
+    )
 
 
 @shared_task
 def create_notification_for_new_product(company_id, product_id):
     company = Company.objects.get(id=company_id)
     product = Product.objects.get(id=product_id)
-    admins_and_owners = CompanyMembership.objects.filter(
-        company=company, role__in=["admin", "owner"]
-    ).select_related("user")
 
     message = f"새로운 물건 {product.name}이(가) {company.name}에 등록되었습니다."
     target_url = product.get_absolute_url()
 
-    for membership in admins_and_owners:
-        Notification.objects.create(
-            recipient=membership.user,
-            company=company,
-            message=message,
-            target_url=target_url,
+    fan_out_notification(
+        company.id, get_admin_and_owner_ids(company.id), message, target_url
+    )
+
+
+def _digest_watermark_key(event, company_id):
+    return f"notifications:digest:{event}:{company_id}"
+
+
+def queue_new_product_notification(company_id, product_id):
+    """
+    회사별 새 상품 알림을 NOTIFICATION_DIGEST_WINDOW초 동안 모아 한 번에 보냄.
+    창을 처음 연 상품만 아웃박스에 작업을 기록하고, 나머지는 그 작업이 함께 집계합니다.
+    """
+    enqueue(
+        flush_new_product_notifications,
+        args=(company_id, product_id),
+        countdown=settings.NOTIFICATION_DIGEST_WINDOW,
+        coalesce_key=_digest_watermark_key("new_product", company_id),
+    )
+
+
+@shared_task
+def flush_new_product_notifications(company_id, first_product_id):
+    """아직 알리지 않은 새 상품(first_product_id 이후)을 알림 한 건으로 묶어 생성"""
+    key = _digest_watermark_key("new_product", company_id)
+    with transaction.atomic():
+        # 같은 회사의 작업이 동시에 돌아도 한 작업만 기준점을 읽고 옮기도록 회사 행을 잠금
+        company = Company.objects.select_for_update().get(id=company_id)
+        products = Product.objects.filter(
+            company_id=company_id, id__gte=first_product_id
+        )
+        # 앞선 창의 작업이 이미 알린 상품은 제외
+        last_notified_id = cache.get(key)
+        if last_notified_id is not None:
+            products = products.filter(id__gt=last_notified_id)
+        summary = products.aggregate(
+            count=Count("id"), first_id=Min("id"), last_id=Max("id")
+        )
+        if not summary["count"]:
+            return 0
+        cache.set(key, summary["last_id"], None)
+
+    first_product = Product.objects.only("id", "name").get(id=summary["first_id"])
+    if summary["count"] == 1:
+        message = (
+            f"새로운 물건 {first_product.name}이(가) {company.name}에 등록되었습니다."
+        )
+        target_url = first_product.get_absolute_url()
+    else:
+        message = (
+            f"새로운 물건 {first_product.name} 외 {summary['count'] - 1}개가 "
+            f"{company.name}에 등록되었습니다."
+        )
+        target_url = (
+            f"http://127.0.0.1:8000/api/v1/products/?company={company_id}"  # 예시 URL
+        )
+
+    return fan_out_notification(
+        company.id, get_admin_and_owner_ids(company.id), message, target_url
+    )
+
+
+@shared_task
+def notify_expiring_lots(days=None):
+    """유통기한이 임박한 남은 재고를 회사별로 묶어 관리자/오너에게 한 번씩 알림"""
+    days = days or settings.EXPIRING_LOT_ALERT_DAYS
+    now = timezone.now()
+    summaries = (
+        ProductRecord.objects.filter(
+            record_type="in",
+            remaining_pieces__gt=0,
+            expiration_date__gte=now,
+            expiration_date__lt=now + timedelta(days=days),
+        )
+        .values("product__company")
+        .annotate(lot_count=Count("id"), product_count=Count("product", distinct=True))
+        .order_by()
+    )
+    summaries = {summary["product__company"]: summary for summary in summaries}
+    if not summaries:
+        return 0
+
+    recipients = {}
+    for company_id, user_id in CompanyMembership.objects.filter(
+        company_id__in=summaries, role__in=["admin", "owner"]
+    ).values_list("company_id", "user_id"):
+        recipients.setdefault(company_id, []).append(user_id)
+
+    created = 0
+    for company_id, recipient_ids in recipients.items():
+        summary = summaries[company_id]
+        message = (
+            f"{days}일 안에 유통기한이 끝나는 재고가 "
+            f"{summary['product_count']}개 상품, {summary['lot_count']}건 있습니다."
+        )
+        target_url = (
+            "http://127.0.0.1:8000/api/v1/products/expiring/"  # 예시 URL
+            f"?company={company_id}&days={days}"
         )
+        created += fan_out_notification(company_id, recipient_ids, message, target_url)
+    return created
+
+
+@shared_task(acks_late=True)
+def purge_read_notifications(days=None, pause=None):
+    """
+    읽은 지 오래된 알림(created_at 기준 days일 경과)을 배치 단위로 삭제합니다.
+    배치 사이에 pause초 쉬어 긴 잠금이나 WAL 급증을 피하고, 삭제한 행 수를 반환합니다.
+    """
+    days = days or settings.NOTIFICATION_RETENTION_DAYS
+    pause = settings.NOTIFICATION_PURGE_PAUSE if pause is None else pause
+    cutoff = timezone.now() - timedelta(days=days)
+    # created_at 인덱스 순서로 오래된 것부터 잘라서 삭제
+    expired = Notification.objects.filter(is_read=True, created_at__lt=cutoff).order_by(
+        "created_at"
+    )
+
+    purged = 0
+    while True:
+        ids = list(expired.values_list("id", flat=True)[:NOTIFICATION_PURGE_BATCH_SIZE])
+        if not ids:
+            break
+        deleted, _ = Notification.objects.filter(id__in=ids).delete()
+        purged += deleted
+        if len(ids) < NOTIFICATION_PURGE_BATCH_SIZE:
+            break
+        time.sleep(pause)
+
+    logger.info(f"Purged {purged} read notifications older than {days} days")
+    return purged
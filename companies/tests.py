@@ -1,3 +1,634 @@
-from django.test import TestCase
+import asyncio
+import threading
+import time
+from datetime import timedelta
+from unittest import mock
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.core.cache.backends.redis import RedisCache
+from django.db import connection
+from django.test import (
+    SimpleTestCase,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+    skipUnlessDBFeature,
+)
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+from core.models import OutboxMessage
+from products.models import Product, ProductRecord
+from users.models import User
+from .models import Company, CompanyMembership, Notification
+from .pubsub import RedisPubSub, notification_channel, reset_pubsub
+from .services import (
+    get_unread_count,
+    increment_unread_counts,
+    issue_stream_ticket,
+    redeem_stream_ticket,
+)
+from .tasks import (
+    create_notifications,
+    fan_out_notification,
+    flush_new_product_notifications,
+    notify_expiring_lots,
+    purge_read_notifications,
+)
 
-# Create your tests here.
+
+@override_settings(NOTIFICATION_PUBSUB={"BACKEND": "companies.pubsub.InMemoryPubSub"})
+class NotificationStreamTests(TestCase):
+    def setUp(self):
+        reset_pubsub()
+        self.addCleanup(reset_pubsub)
+        self.addCleanup(cache.clear)
+        self.user = User.objects.create(username="tester")
+        self.company = Company.objects.create(name="ocelot", owner=self.user)
+
+    def issue_ticket(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.post("/api/v1/companies/notifications/stream/ticket/")
+        self.assertEqual(response.status_code, 201)
+        return response.json()["ticket"]
+
+    async def test_requires_token(self):
+        response = await self.async_client.get(
+            "/api/v1/companies/notifications/stream/"
+        )
+
+        self.assertEqual(response.status_code, 401)
+
+    async def test_does_not_accept_jwt_in_query(self):
+        token = str(AccessToken.for_user(self.user))
+        response = await self.async_client.get(
+            "/api/v1/companies/notifications/stream/", {"ticket": token}
+        )
+
+        self.assertEqual(response.status_code, 401)
+
+    async def test_accepts_jwt_in_authorization_header(self):
+        token = str(AccessToken.for_user(self.user))
+        response = await self.async_client.get(
+            "/api/v1/companies/notifications/stream/",
+            headers={"Authorization": f"Bearer {token}"},
+        )
+
+        self.assertEqual(response.status_code, 200)
+        await aiter(response.streaming_content).aclose()
+
+    def test_rejects_wsgi_requests(self):
+        response = self.client.get(
+            "/api/v1/companies/notifications/stream/", {"ticket": self.issue_ticket()}
+        )
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_ticket_expires(self):
+        ticket = issue_stream_ticket(self.user.id)
+
+        # 유효 시간(30초)이 지난 뒤
+        with mock.patch("time.time", return_value=time.time() + 31):
+            self.assertIsNone(redeem_stream_ticket(ticket))
+
+    async def test_ticket_can_be_used_once(self):
+        ticket = await sync_to_async(self.issue_ticket)()
+        response = await self.async_client.get(
+            "/api/v1/companies/notifications/stream/", {"ticket": ticket}
+        )
+        self.assertEqual(response.status_code, 200)
+        await aiter(response.streaming_content).aclose()
+
+        response = await self.async_client.get(
+            "/api/v1/companies/notifications/stream/", {"ticket": ticket}
+        )
+
+        self.assertEqual(response.status_code, 401)
+
+    async def test_pushes_new_notifications_to_recipient(self):
+        ticket = await sync_to_async(self.issue_ticket)()
+        response = await self.async_client.get(
+            "/api/v1/companies/notifications/stream/", {"ticket": ticket}
+        )
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        events = aiter(response.streaming_content)
+        self.assertEqual(await anext(events), b"retry: 5000\n\n")
+
+        await sync_to_async(create_notifications)(
+            self.company.id, [self.user.id], "새 알림"
+        )
+
+        event = (await anext(events)).decode()
+        self.assertTrue(event.startswith("event: notification\ndata: "))
+        self.assertIn("새 알림", event)
+        await events.aclose()
+
+
+class FakeRedisConnectionPubSub:
+    """redis.asyncio PubSub 대역. 명령을 기록하고 publish()로 메시지를 흘려 넣음"""
+
+    def __init__(self):
+        self.commands = []
+        self.messages = asyncio.Queue()
+
+    async def subscribe(self, channel):
+        self.commands.append(("subscribe", channel))
+
+    async def unsubscribe(self, channel):
+        self.commands.append(("unsubscribe", channel))
+
+    async def get_message(self, ignore_subscribe_messages, timeout):
+        return await self.messages.get()
+
+    def publish(self, channel, data):
+        self.messages.put_nowait(
+            {"type": "message", "channel": channel.encode(), "data": data.encode()}
+        )
+
+
+class RedisPubSubTests(SimpleTestCase):
+    async def test_shares_one_connection_across_subscribers(self):
+        connection = FakeRedisConnectionPubSub()
+        with mock.patch("companies.pubsub.aioredis.Redis.from_url") as from_url:
+            from_url.return_value.pubsub.return_value = connection
+            pubsub = RedisPubSub("redis://localhost:6379/2")
+            subscriptions = [
+                await pubsub.subscribe(notification_channel(1)) for _ in range(3)
+            ]
+            other = await pubsub.subscribe(notification_channel(2))
+
+            connection.publish(notification_channel(1), "새 알림")
+            messages = [await s.get(timeout=1) for s in subscriptions]
+            for subscription in subscriptions:
+                await subscription.close()
+            await other.close()
+
+        self.assertEqual(from_url.call_count, 1)
+        self.assertEqual(messages, ["새 알림"] * 3)
+        self.assertEqual(
+            connection.commands,
+            [
+                ("subscribe", "notifications:1"),
+                ("subscribe", "notifications:2"),
+                ("unsubscribe", "notifications:1"),
+                ("unsubscribe", "notifications:2"),
+            ],
+        )
+        pubsub._reader.cancel()
+
+
+@override_settings(NOTIFICATION_PUBSUB={"BACKEND": "companies.pubsub.InMemoryPubSub"})
+class NewProductDigestTests(TestCase):
+    def setUp(self):
+        reset_pubsub()
+        self.addCleanup(reset_pubsub)
+        self.addCleanup(cache.clear)
+        self.user = User.objects.create(username="tester")
+        self.company = Company.objects.create(name="ocelot", owner=self.user)
+        # save()의 가입 알림 작업 발행을 피하기 위해 bulk_create 사용
+        CompanyMembership.objects.bulk_create(
+            [CompanyMembership(company=self.company, user=self.user, role="owner")]
+        )
+
+    def create_product(self, name="상품"):
+        return Product.objects.create(name=name, category="food", company=self.company)
+
+    def pending_flushes(self):
+        return OutboxMessage.objects.filter(
+            task_name=flush_new_product_notifications.name
+        ).order_by("id")
+
+    def test_burst_of_products_creates_one_notification(self):
+        first = self.create_product("첫 상품")
+        for _ in range(36):
+            self.create_product()
+
+        self.assertEqual(
+            list(self.pending_flushes().values_list("args", "countdown")),
+            [([self.company.id, first.id], 60)],
+        )
+        flush_new_product_notifications(self.company.id, first.id)
+
+        notification = Notification.objects.get(recipient=self.user)
+        self.assertEqual(
+            notification.message,
+            "새로운 물건 첫 상품 외 36개가 ocelot에 등록되었습니다.",
+        )
+        self.assertEqual(
+            notification.target_url,
+            f"http://127.0.0.1:8000/api/v1/products/?company={self.company.id}",
+        )
+
+    def test_products_are_not_counted_twice_across_windows(self):
+        first = self.create_product("첫 상품")
+        self.create_product()
+        # 창이 지난 뒤 등록된 상품은 새 창을 엶
+        self.pending_flushes().update(created_at=timezone.now() - timedelta(seconds=61))
+        late = self.create_product("늦은 상품")
+        self.assertEqual(self.pending_flushes().count(), 2)
+
+        # 첫 창의 작업이 늦게 돌면 다음 창의 상품까지 함께 알림
+        self.assertEqual(flush_new_product_notifications(self.company.id, first.id), 1)
+        self.assertEqual(flush_new_product_notifications(self.company.id, late.id), 0)
+
+        self.assertEqual(
+            Notification.objects.get(recipient=self.user).message,
+            "새로운 물건 첫 상품 외 2개가 ocelot에 등록되었습니다.",
+        )
+
+
+@skipUnlessDBFeature("has_select_for_update")
+class ConcurrentNewProductDigestTests(TransactionTestCase):
+    def setUp(self):
+        self.addCleanup(cache.clear)
+        self.user = User.objects.create(username="tester")
+        self.company = Company.objects.create(name="ocelot", owner=self.user)
+        CompanyMembership.objects.bulk_create(
+            [CompanyMembership(company=self.company, user=self.user, role="owner")]
+        )
+
+    def test_concurrent_flushes_notify_each_product_once(self):
+        products = Product.objects.bulk_create(
+            [
+                Product(name=f"상품 {i}", category="food", company=self.company)
+                for i in range(5)
+            ]
+        )
+        results = []
+        barrier = threading.Barrier(4)
+
+        def flush():
+            barrier.wait()
+            try:
+                results.append(
+                    flush_new_product_notifications(self.company.id, products[0].id)
+                )
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=flush) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # 기준점을 먼저 옮긴 작업 하나만 알림을 생성
+        self.assertEqual(sorted(results), [0, 0, 0, 1])
+        self.assertEqual(Notification.objects.filter(recipient=self.user).count(), 1)
+
+
+class UnreadCountTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def test_cold_count_expires_quickly(self):
+        with mock.patch("companies.services.Notification.objects") as objects:
+            objects.filter.return_value.count.return_value = 4
+            self.assertEqual(get_unread_count(1), 4)
+
+        # 세는 동안 생긴 알림이 빠졌더라도 곧 다시 셈
+        with mock.patch("time.time", return_value=time.time() + 61):
+            self.assertIsNone(cache.get("notifications:unread:1"))
+
+    def test_increments_only_cached_counts(self):
+        cache.set("notifications:unread:1", 3)
+
+        increment_unread_counts([1, 2], 2)
+
+        self.assertEqual(cache.get("notifications:unread:1"), 5)
+        self.assertIsNone(cache.get("notifications:unread:2"))
+
+    @override_settings(
+        CACHES={
+            "default": {
+                "BACKEND": "django.core.cache.backends.redis.RedisCache",
+                "LOCATION": "redis://primary:6379/1,redis://replica:6379/1",
+            }
+        }
+    )
+    @mock.patch("companies.services._redis_client", None)
+    @mock.patch("companies.services.redis.Redis.from_url")
+    def test_redis_increments_all_recipients_in_one_script_call(self, from_url):
+        backend = RedisCache("redis://primary:6379/1", {})
+        with mock.patch("companies.services.caches", {"default": backend}):
+            increment_unread_counts(range(2000))
+
+        # 캐시 백엔드 내부가 아닌 쓰기용 서버에 직접 연결한 클라이언트 사용
+        from_url.assert_called_once_with("redis://primary:6379/1")
+        client = from_url.return_value
+
+        client.register_script.assert_called_once()
+        script = client.register_script.return_value
+        script.assert_called_once()
+        self.assertEqual(len(script.call_args.kwargs["keys"]), 2000)
+        self.assertEqual(script.call_args.kwargs["args"], [1])
+
+
+class PurgeReadNotificationsTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="tester")
+        self.company = Company.objects.create(name="ocelot", owner=self.user)
+
+    def create_notifications(self, count, is_read, days_ago):
+        notifications = Notification.objects.bulk_create(
+            [
+                Notification(
+                    recipient=self.user,
+                    company=self.company,
+                    message="알림",
+                    is_read=is_read,
+                )
+                for _ in range(count)
+            ]
+        )
+        # created_at은 auto_now_add라 생성 후 갱신
+        Notification.objects.filter(id__in=[n.id for n in notifications]).update(
+            created_at=timezone.now() - timedelta(days=days_ago)
+        )
+
+    @mock.patch("companies.tasks.NOTIFICATION_PURGE_BATCH_SIZE", 2)
+    def test_purges_only_old_read_notifications_in_batches(self):
+        self.create_notifications(5, is_read=True, days_ago=100)
+        self.create_notifications(2, is_read=False, days_ago=100)
+        self.create_notifications(3, is_read=True, days_ago=10)
+
+        with mock.patch("companies.tasks.time.sleep") as sleep:
+            purged = purge_read_notifications(days=90)
+
+        self.assertEqual(purged, 5)
+        self.assertEqual(sleep.call_count, 2)
+        self.assertEqual(Notification.objects.count(), 5)
+        self.assertFalse(
+            Notification.objects.filter(
+                is_read=True, created_at__lt=timezone.now() - timedelta(days=90)
+            ).exists()
+        )
+
+
+class NotificationBulkMarkReadTests(TestCase):
+    def setUp(self):
+        self.addCleanup(cache.clear)
+        self.user = User.objects.create(username="tester")
+        self.other_user = User.objects.create(username="other")
+        self.company = Company.objects.create(name="ocelot", owner=self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_notifications(self, count, recipient=None, is_read=False, days_ago=0):
+        notifications = Notification.objects.bulk_create(
+            [
+                Notification(
+                    recipient=recipient or self.user,
+                    company=self.company,
+                    message="알림",
+                    is_read=is_read,
+                )
+                for _ in range(count)
+            ]
+        )
+        # created_at은 auto_now_add라 생성 후 갱신
+        Notification.objects.filter(id__in=[n.id for n in notifications]).update(
+            created_at=timezone.now() - timedelta(days=days_ago)
+        )
+        return [notification.id for notification in notifications]
+
+    def mark_read(self, data):
+        return self.client.post(
+            "/api/v1/companies/notifications/mark-read/", data, format="json"
+        )
+
+    def test_marks_listed_ids_of_own_notifications(self):
+        mine = self.create_notifications(4)
+        already_read = self.create_notifications(1, is_read=True)
+        others = self.create_notifications(2, recipient=self.other_user)
+        self.assertEqual(get_unread_count(self.user.id), 4)
+        self.assertEqual(get_unread_count(self.other_user.id), 2)
+
+        response = self.mark_read({"ids": mine[:3] + already_read + others})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {"updated": 3})
+        self.assertEqual(
+            list(
+                Notification.objects.filter(
+                    recipient=self.user, is_read=False
+                ).values_list("id", flat=True)
+            ),
+            mine[3:],
+        )
+        self.assertFalse(Notification.objects.filter(id__in=others, is_read=True))
+        # 실제로 바뀐 행 수만큼만 캐시된 안 읽은 수를 줄임
+        self.assertEqual(get_unread_count(self.user.id), 1)
+        self.assertEqual(get_unread_count(self.other_user.id), 2)
+
+    def test_marks_own_notifications_before_given_time(self):
+        old = self.create_notifications(3, days_ago=2)
+        recent = self.create_notifications(2)
+        others = self.create_notifications(2, recipient=self.other_user, days_ago=2)
+        self.assertEqual(get_unread_count(self.user.id), 5)
+
+        response = self.mark_read(
+            {"before": (timezone.now() - timedelta(days=1)).isoformat()}
+        )
+
+        self.assertEqual(response.json(), {"updated": 3})
+        self.assertFalse(Notification.objects.filter(id__in=old, is_read=False))
+        self.assertFalse(Notification.objects.filter(id__in=recent, is_read=True))
+        self.assertFalse(Notification.objects.filter(id__in=others, is_read=True))
+        self.assertEqual(get_unread_count(self.user.id), 2)
+        self.assertEqual(get_unread_count(self.other_user.id), 2)
+
+    def test_requires_exactly_one_of_ids_and_before(self):
+        self.assertEqual(self.mark_read({}).status_code, 400)
+        response = self.mark_read({"ids": [1], "before": timezone.now().isoformat()})
+        self.assertEqual(response.status_code, 400)
+
+    def test_rejects_more_than_1000_ids(self):
+        response = self.mark_read({"ids": list(range(1, 1002))})
+
+        self.assertEqual(response.status_code, 400)
+
+
+class NotificationListTests(TestCase):
+    url = "/api/v1/companies/notifications/"
+
+    def setUp(self):
+        self.user = User.objects.create(username="tester")
+        other_user = User.objects.create(username="other")
+        self.company = Company.objects.create(name="ocelot", owner=self.user)
+        now = timezone.now()
+        notifications = Notification.objects.bulk_create(
+            [
+                Notification(
+                    recipient=self.user,
+                    company=self.company,
+                    message=f"알림 {index}",
+                    is_read=index % 2 == 0,
+                )
+                for index in range(5)
+            ]
+            + [
+                Notification(
+                    recipient=other_user,
+                    company=self.company,
+                    message="다른 사람의 알림",
+                )
+            ]
+        )
+        # 두 알림은 같은 시각이라 id로 순서를 정함
+        for notification, minutes_ago in zip(notifications, [3, 1, 1, 2, 0]):
+            Notification.objects.filter(id=notification.id).update(
+                created_at=now - timedelta(minutes=minutes_ago)
+            )
+        self.expected_ids = [
+            notifications[4].id,
+            notifications[2].id,
+            notifications[1].id,
+            notifications[3].id,
+            notifications[0].id,
+        ]
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def collect_ids(self, params):
+        response = self.client.get(self.url, {"page_size": 2, **params})
+        self.assertEqual(response.status_code, 200)
+        ids = []
+        while True:
+            ids += [notification["id"] for notification in response.data["results"]]
+            if not response.data["next"]:
+                return ids
+            response = self.client.get(response.data["next"])
+
+    def test_cursor_pages_follow_created_at_then_id(self):
+        self.assertEqual(self.collect_ids({}), self.expected_ids)
+
+    def test_filters_by_is_read(self):
+        read_ids = list(
+            Notification.objects.filter(recipient=self.user, is_read=True).values_list(
+                "id", flat=True
+            )
+        )
+
+        read = self.collect_ids({"is_read": "true"})
+        unread = self.collect_ids({"is_read": "false"})
+
+        self.assertEqual(read, [pk for pk in self.expected_ids if pk in read_ids])
+        self.assertEqual(unread, [pk for pk in self.expected_ids if pk not in read_ids])
+
+    def test_rejects_invalid_is_read(self):
+        response = self.client.get(self.url, {"is_read": "yes"})
+
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(NOTIFICATION_PUBSUB={"BACKEND": "companies.pubsub.InMemoryPubSub"})
+class NotifyExpiringLotsTests(TestCase):
+    def setUp(self):
+        reset_pubsub()
+        self.addCleanup(reset_pubsub)
+        self.owner = User.objects.create(username="owner")
+        self.admin = User.objects.create(username="admin")
+        self.employee = User.objects.create(username="employee")
+        self.company = Company.objects.create(name="ocelot", owner=self.owner)
+        quiet_company = Company.objects.create(name="quiet", owner=self.owner)
+        # save()의 가입 알림 작업 발행을 피하기 위해 bulk_create 사용
+        CompanyMembership.objects.bulk_create(
+            [
+                CompanyMembership(company=self.company, user=self.owner, role="owner"),
+                CompanyMembership(company=self.company, user=self.admin, role="admin"),
+                CompanyMembership(
+                    company=self.company, user=self.employee, role="employee"
+                ),
+                CompanyMembership(company=quiet_company, user=self.owner, role="owner"),
+            ]
+        )
+        self.products = Product.objects.bulk_create(
+            [
+                Product(name=name, category="food", company=company)
+                for name, company in [
+                    ("우유", self.company),
+                    ("치즈", self.company),
+                    ("두부", quiet_company),
+                ]
+            ]
+        )
+
+    def create_lot(self, product, days_left):
+        record = ProductRecord(product=product, record_type="in", box_quantity=1)
+        record.save()
+        ProductRecord.objects.filter(id=record.id).update(
+            expiration_date=timezone.now() + timedelta(days=days_left)
+        )
+
+    def test_sends_one_summary_per_company_to_admins_and_owners(self):
+        milk, cheese, tofu = self.products
+        self.create_lot(milk, 1)
+        self.create_lot(milk, 3)
+        self.create_lot(cheese, 6)
+        self.create_lot(cheese, 20)
+        self.create_lot(tofu, 20)
+
+        self.assertEqual(notify_expiring_lots(days=7), 2)
+
+        notifications = Notification.objects.order_by("recipient_id")
+        self.assertEqual(
+            [notification.recipient for notification in notifications],
+            [self.owner, self.admin],
+        )
+        self.assertEqual(
+            notifications[0].message,
+            "7일 안에 유통기한이 끝나는 재고가 2개 상품, 3건 있습니다.",
+        )
+        self.assertEqual(
+            notifications[0].target_url,
+            "http://127.0.0.1:8000/api/v1/products/expiring/"
+            f"?company={self.company.id}&days=7",
+        )
+
+    def test_does_nothing_without_expiring_lots(self):
+        self.create_lot(self.products[0], 30)
+
+        self.assertEqual(notify_expiring_lots(days=7), 0)
+        self.assertFalse(Notification.objects.exists())
+
+
+@override_settings(NOTIFICATION_PUBSUB={"BACKEND": "companies.pubsub.InMemoryPubSub"})
+class FanOutNotificationTests(TestCase):
+    def setUp(self):
+        reset_pubsub()
+        self.addCleanup(reset_pubsub)
+        self.user = User.objects.create(username="tester")
+        self.company = Company.objects.create(name="ocelot", owner=self.user)
+
+    def test_creates_notifications_directly_for_few_recipients(self):
+        created = fan_out_notification(self.company.id, [self.user.id], "알림")
+
+        self.assertEqual(created, 1)
+        self.assertTrue(Notification.objects.filter(recipient=self.user).exists())
+
+    @mock.patch("companies.tasks.create_notifications.delay")
+    def test_splits_many_recipients_into_subtasks(self, delay):
+        recipient_ids = list(range(1, 4501))
+
+        scheduled = fan_out_notification(
+            self.company.id, recipient_ids, "알림", "http://example.com/"
+        )
+
+        self.assertEqual(scheduled, 4500)
+        self.assertEqual(
+            [call.args for call in delay.call_args_list],
+            [
+                (self.company.id, recipient_ids[:2000], "알림", "http://example.com/"),
+                (
+                    self.company.id,
+                    recipient_ids[2000:4000],
+                    "알림",
+                    "http://example.com/",
+                ),
+                (self.company.id, recipient_ids[4000:], "알림", "http://example.com/"),
+            ],
+        )
+        self.assertFalse(Notification.objects.exists())
@@ -1,4 +1,5 @@
 from django.urls import path
+from .streams import notification_stream
 from .views import (
     CompanyMembersListView,
     CompanyPromoteMembersView,
@@ -9,7 +10,10 @@ from .views import (
     CompanyView,
     CompanyDetailView,
     NotificationListView,
+    NotificationBulkMarkReadView,
     NotificationMarkReadView,
+    NotificationStreamTicketView,
+    NotificationUnreadCountView,
 )
 
 
@@ -17,6 +21,26 @@ urlpatterns = [
     path("", CompanyView.as_view(), name="company"),
     path("<int:pk>/", CompanyDetailView.as_view(), name="company_detail"),
     path("notifications/", NotificationListView.as_view(), name="notification_list"),
+    path(
+        "notifications/mark-read/",
+        NotificationBulkMarkReadView.as_view(),
+        name="notification_bulk_mark_read",
+    ),
+    path(
+        "notifications/stream/",
+        notification_stream,
+        name="notification_stream",
+    ),
+    path(
+        "notifications/stream/ticket/",
+        NotificationStreamTicketView.as_view(),
+        name="notification_stream_ticket",
+    ),
+    path(
+        "notifications/unread-count/",
+        NotificationUnreadCountView.as_view(),
+        name="notification_unread_count",
+    ),
     path(
         "notifications/<int:id>/mark-read/",
         NotificationMarkReadView.as_view(),
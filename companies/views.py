@@ -1,5 +1,8 @@
+from django.conf import settings
 from django.db.models import Q
+from rest_framework.exceptions import ValidationError
 from rest_framework.generics import ListAPIView, UpdateAPIView
+from rest_framework.pagination import CursorPagination
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
@@ -9,7 +12,13 @@ from .permissions import (
     IsCompanyOwner,
 )
 from .models import Company, CompanyMembership, Department, Invitation, Notification
-from .serializers import CompanySerializer, DepartmentSerializer, NotificationSerializer
+from .serializers import (
+    CompanySerializer,
+    DepartmentSerializer,
+    NotificationBulkMarkReadSerializer,
+    NotificationSerializer,
+)
+from .services import decrement_unread_count, get_unread_count, issue_stream_ticket
 from django.utils import timezone
 from datetime import timedelta
 import uuid
@@ -289,17 +298,32 @@ class InvitationAcceptView(APIView):
         return Response({"message": "초대가 수락되었습니다."})
 
 
+class NotificationPagination(CursorPagination):
+    page_size = 20
+    page_size_query_param = "page_size"
+    max_page_size = 100
+    ordering = ("-created_at", "-id")
+
+
 class NotificationListView(ListAPIView):
+    """
+    기능 : 내 알림을 최신순 커서 페이지네이션으로 조회합니다. (?is_read=true|false)
+    허용 : 로그인한 사용자
+    """
+
     serializer_class = NotificationSerializer
-    permission_classes = [IsAuthenticated, IsCompanyAdminOrOwner]
+    permission_classes = [IsAuthenticated]
+    pagination_class = NotificationPagination
 
     def get_queryset(self):
-        # 현재 유저가 수신자인 모든 알림 반환
-        return (
-            Notification.objects.filter(recipient=self.request.user)
-            .select_related("company", "recipient")
-            .order_by("-created_at")
-        )
+        # 현재 유저가 수신자인 알림만 반환
+        queryset = Notification.objects.filter(recipient=self.request.user)
+        is_read = self.request.query_params.get("is_read")
+        if is_read is not None:
+            if is_read not in ("true", "false"):
+                raise ValidationError({"is_read": "true 또는 false만 가능합니다."})
+            queryset = queryset.filter(is_read=is_read == "true")
+        return queryset
 
 
 class NotificationMarkReadView(UpdateAPIView):
@@ -312,7 +336,71 @@ class NotificationMarkReadView(UpdateAPIView):
 
     def update(self, request, *args, **kwargs):
         instance = self.get_object()
+        # 동시에 같은 알림을 읽음 처리해도 한 번만 차감되도록 조건부 UPDATE
+        if Notification.objects.filter(pk=instance.pk, is_read=False).update(
+            is_read=True
+        ):
+            decrement_unread_count(request.user.id)
         instance.is_read = True
-        instance.save(update_fields=["is_read"])
         serializer = self.get_serializer(instance)
         return Response(serializer.data, status=status.HTTP_200_OK)
+
+
+class NotificationBulkMarkReadView(APIView):
+    """
+    기능 : 여러 알림을 한 번에 읽음 처리합니다. (ids 목록 또는 before 시각 이전 전체)
+    허용 : 로그인한 사용자
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        serializer = NotificationBulkMarkReadSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        notifications = Notification.objects.filter(
+            recipient=request.user, is_read=False
+        )
+        if "ids" in serializer.validated_data:
+            notifications = notifications.filter(
+                id__in=serializer.validated_data["ids"]
+            )
+        else:
+            notifications = notifications.filter(
+                created_at__lte=serializer.validated_data["before"]
+            )
+        updated = notifications.update(is_read=True)
+        if updated:
+            decrement_unread_count(request.user.id, updated)
+        return Response({"updated": updated})
+
+
+class NotificationStreamTicketView(APIView):
+    """
+    기능 : 실시간 알림 스트림 접속용 일회용 티켓을 발급합니다. (EventSource URL의 ?ticket=에 사용)
+    허용 : 로그인한 사용자
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        return Response(
+            {
+                "ticket": issue_stream_ticket(request.user.id),
+                "expires_in": settings.NOTIFICATION_STREAM_TICKET_TTL,
+            },
+            status=status.HTTP_201_CREATED,
+        )
+
+
+class NotificationUnreadCountView(APIView):
+    """
+    기능 : 안 읽은 알림 수를 조회합니다. (캐시된 카운터 사용)
+    허용 : 로그인한 사용자
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        return Response({"unread_count": get_unread_count(request.user.id)})
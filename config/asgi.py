@@ -5,6 +5,17 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
+
+The notification stream (Server-Sent Events) keeps connections open and is
+served only from this entry point (see the ``push`` process in the Procfile).
+The WSGI ``web`` process answers the stream URL with 400, so one open
+EventSource cannot pin a sync worker.
+
+``push`` binds to ``$PORT`` like ``web`` but is a separate service: give it its
+own hostname, or route ``/api/v1/companies/notifications/stream/`` to it at the
+load balancer, with response buffering off and an idle timeout above the
+20-second keepalive. On platforms that only route HTTP to the ``web`` process
+type (e.g. Heroku), deploy ``push`` as a separate app that uses the same settings.
 """
 
 import os
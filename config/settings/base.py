@@ -1,5 +1,6 @@
 import os
 from pathlib import Path
+from celery.schedules import crontab
 from decouple import config
 from django.utils.timezone import timedelta
 from drf_yasg import openapi
@@ -116,3 +117,80 @@ CELERY_BROKER_URL = config("CELERY_BROKER_URL", default="redis://localhost:6379/
 CELERY_RESULT_BACKEND = config(
     "CELERY_RESULT_BACKEND", default="redis://localhost:6379/0"
 )
+CELERY_TIMEZONE = TIME_ZONE
+# 발행용 브로커 연결 풀 크기와 접속 제한
+# (끊긴 연결은 바로 한 번만 다시 접속하고, 실패하면 core.broker가 장애로 기록)
+CELERY_BROKER_POOL_LIMIT = config("CELERY_BROKER_POOL_LIMIT", default=10, cast=int)
+CELERY_BROKER_CONNECTION_TIMEOUT = 2
+CELERY_BROKER_TRANSPORT_OPTIONS = {
+    "socket_connect_timeout": 2,
+    "socket_timeout": 5,
+    "max_retries": 1,
+    "interval_start": 0,
+}
+# 작업 종류별 큐 (워커 구성은 Procfile 참고). 지정하지 않은 작업은 기본 celery 큐
+CELERY_TASK_ROUTES = {
+    "products.tasks.upload_product_images_task": {"queue": "images"},
+    "products.tasks.upload_image_to_cloudflare_task": {"queue": "images"},
+    "products.tasks.create_daily_stock_snapshots": {"queue": "maintenance"},
+    "companies.tasks.notify_expiring_lots": {"queue": "maintenance"},
+    "companies.tasks.purge_read_notifications": {"queue": "maintenance"},
+    "companies.tasks.*": {"queue": "notifications"},
+}
+CELERY_BEAT_SCHEDULE = {
+    "create-daily-stock-snapshots": {
+        "task": "products.tasks.create_daily_stock_snapshots",
+        "schedule": crontab(hour=0, minute=10),
+    },
+    "notify-expiring-lots": {
+        "task": "companies.tasks.notify_expiring_lots",
+        "schedule": crontab(hour=8, minute=0),
+    },
+    "purge-read-notifications": {
+        "task": "companies.tasks.purge_read_notifications",
+        "schedule": crontab(hour=3, minute=30),
+    },
+}
+
+# 실시간 알림 전달용 pub/sub (테스트는 companies.pubsub.InMemoryPubSub)
+NOTIFICATION_PUBSUB = {
+    "BACKEND": "companies.pubsub.RedisPubSub",
+    "OPTIONS": {
+        "url": config("NOTIFICATION_PUBSUB_URL", default="redis://localhost:6379/2")
+    },
+}
+
+# 실시간 알림 스트림 접속용 일회용 티켓의 유효 시간(초)
+NOTIFICATION_STREAM_TICKET_TTL = config("NOTIFICATION_STREAM_TICKET_TTL", default=30, cast=int)
+
+# 새 상품 알림을 모아 보내는 간격(초)
+NOTIFICATION_DIGEST_WINDOW = config("NOTIFICATION_DIGEST_WINDOW", default=60, cast=int)
+
+# 읽은 알림 보관 일 수와 삭제 배치 사이 대기 시간(초)
+NOTIFICATION_RETENTION_DAYS = config("NOTIFICATION_RETENTION_DAYS", default=90, cast=int)
+NOTIFICATION_PURGE_PAUSE = config("NOTIFICATION_PURGE_PAUSE", default=0.5, cast=float)
+
+# 이미지 서비스 연결 풀 크기(이미지 워커 스레드 수 x 상품당 동시 업로드 수)와
+# 접속/응답 대기 시간(초)
+CLOUDFLARE_POOL_SIZE = config("CLOUDFLARE_POOL_SIZE", default=32, cast=int)
+CLOUDFLARE_CONNECT_TIMEOUT = config("CLOUDFLARE_CONNECT_TIMEOUT", default=3.05, cast=float)
+CLOUDFLARE_READ_TIMEOUT = config("CLOUDFLARE_READ_TIMEOUT", default=30, cast=float)
+
+# 이미지 서비스가 연속으로 실패하면 이 시간(초) 동안 업로드를 멈춤
+CLOUDFLARE_CIRCUIT_FAILURE_THRESHOLD = config(
+    "CLOUDFLARE_CIRCUIT_FAILURE_THRESHOLD", default=5, cast=int
+)
+CLOUDFLARE_CIRCUIT_RESET_TIMEOUT = config(
+    "CLOUDFLARE_CIRCUIT_RESET_TIMEOUT", default=60, cast=int
+)
+
+# 업로드 전 이미지 정규화: 긴 변 최대 크기, 썸네일 크기, 인코딩 형식(WEBP/JPEG)과 품질,
+# 변환 프로세스 수 (0이면 작업 스레드에서 바로 변환)
+IMAGE_MAX_SIZE = config("IMAGE_MAX_SIZE", default=2048, cast=int)
+IMAGE_THUMBNAIL_SIZE = config("IMAGE_THUMBNAIL_SIZE", default=320, cast=int)
+IMAGE_FORMAT = config("IMAGE_FORMAT", default="WEBP")
+IMAGE_QUALITY = config("IMAGE_QUALITY", default=82, cast=int)
+IMAGE_PROCESS_WORKERS = config("IMAGE_PROCESS_WORKERS", default=2, cast=int)
+
+# 유통기한 임박 알림 기준 일 수
+EXPIRING_LOT_ALERT_DAYS = config("EXPIRING_LOT_ALERT_DAYS", default=7, cast=int)
@@ -1,3 +1,10 @@
 from django.contrib import admin
+from .models import OutboxMessage
 
-# Register your models here.
+
+@admin.register(OutboxMessage)
+class OutboxMessageAdmin(admin.ModelAdmin):
+    list_display = ("task_name", "created_at", "published_at", "attempts")
+    list_filter = ("task_name",)
+    search_fields = ("task_name", "last_error")
+    readonly_fields = ("created_at", "published_at")
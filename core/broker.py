@@ -0,0 +1,66 @@
+import logging
+import time
+from contextlib import contextmanager
+from celery.exceptions import OperationalError
+from kombu.exceptions import LimitExceeded
+from redis.exceptions import ConnectionError, TimeoutError
+from config.celery import app as celery_app
+
+logger = logging.getLogger(__name__)
+
+# 브로커 장애를 감지하면 이 시간(초) 동안은 접속을 시도하지 않고 바로 실패
+BROKER_RETRY_AFTER = 10
+# 연결 풀이 모두 사용 중일 때 기다리는 최대 시간(초)
+PRODUCER_ACQUIRE_TIMEOUT = 1
+
+BROKER_ERRORS = (OperationalError, ConnectionError, TimeoutError, OSError)
+
+# 프로세스마다 따로 기억하는 브로커 장애 만료 시각 (time.monotonic 기준)
+_down_until = 0.0
+
+
+class BrokerUnavailable(Exception):
+    pass
+
+
+def is_broker_available():
+    return time.monotonic() >= _down_until
+
+
+def mark_broker_down(error):
+    global _down_until
+    _down_until = time.monotonic() + BROKER_RETRY_AFTER
+    logger.warning(
+        f"Broker unavailable, skipping publish for {BROKER_RETRY_AFTER}s: {str(error)}"
+    )
+
+
+@contextmanager
+def pooled_producer():
+    """
+    프로세스 공용 연결 풀에서 producer를 빌려 줍니다.
+    브로커 장애가 기록된 동안이나 풀이 가득 찼을 때는 접속 없이 BrokerUnavailable을 냅니다.
+    """
+    if not is_broker_available():
+        raise BrokerUnavailable("Broker is marked as down")
+    try:
+        with celery_app.producer_pool.acquire(
+            block=True, timeout=PRODUCER_ACQUIRE_TIMEOUT
+        ) as producer:
+            yield producer
+    except LimitExceeded as e:
+        raise BrokerUnavailable("No free broker connection in pool") from e
+    except BROKER_ERRORS as e:
+        mark_broker_down(e)
+        raise BrokerUnavailable(str(e)) from e
+
+
+def publish(task, args=(), kwargs=None, **options):
+    """
+    풀의 연결로 task를 한 번만 발행합니다. kombu의 재시도 대기 없이 실패하면 BrokerUnavailable.
+    결과를 기다리지 않으므로 결과 백엔드 구독(과 그 재접속 대기)도 건너뜁니다.
+    """
+    with pooled_producer() as producer:
+        return task.apply_async(
+            args, kwargs, producer=producer, retry=False, ignore_result=True, **options
+        )
@@ -0,0 +1,39 @@
+import time
+from django.core.management.base import BaseCommand
+from core.outbox import OUTBOX_BATCH_SIZE, purge_published_messages, relay_outbox
+
+
+class Command(BaseCommand):
+    help = "아웃박스에 기록된 Celery 작업을 브로커로 발행합니다."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=1.0,
+            help="발행할 메시지가 없을 때 다음 확인까지 대기 시간(초)",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=OUTBOX_BATCH_SIZE,
+            help="한 번에 발행하는 최대 메시지 수",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="대기 중인 메시지를 한 번만 발행하고 종료합니다.",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            published = relay_outbox(options["batch_size"])
+            if options["once"]:
+                self.stdout.write(
+                    self.style.SUCCESS(f"메시지 {published}개를 발행했습니다.")
+                )
+                return
+            if published < options["batch_size"]:
+                # 밀린 메시지가 없을 때만 정리하고 쉼
+                purge_published_messages()
+                time.sleep(options["interval"])
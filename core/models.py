@@ -9,3 +9,35 @@ class CommonModel(models.Model):
 
     class Meta:
         abstract = True
+
+
+class OutboxMessage(models.Model):
+    """
+    커밋과 함께 기록되는 Celery 작업 발행 요청.
+    요청 처리 중에는 브로커에 접속하지 않고, relay_outbox가 모아서 발행합니다.
+    """
+
+    task_name = models.CharField(max_length=255)
+    args = models.JSONField(default=list)
+    kwargs = models.JSONField(default=dict)
+    countdown = models.PositiveIntegerField(null=True, blank=True)
+    coalesce_key = models.CharField(max_length=255, null=True, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    published_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # 발행 대기 메시지 조회용
+            models.Index(
+                fields=["id"],
+                condition=models.Q(published_at__isnull=True),
+                name="outbox_pending_idx",
+            ),
+            models.Index(fields=["coalesce_key", "created_at"]),
+            models.Index(fields=["published_at"]),
+        ]
+
+    def __str__(self):
+        return f"{self.task_name} {self.args}"
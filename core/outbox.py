@@ -0,0 +1,102 @@
+import logging
+from datetime import timedelta
+from django.db import transaction
+from django.utils import timezone
+from config.celery import app as celery_app
+from core.broker import BrokerUnavailable, is_broker_available, pooled_producer, publish
+from core.models import OutboxMessage
+
+logger = logging.getLogger(__name__)
+
+# 한 번에 발행하는 최대 메시지 수
+OUTBOX_BATCH_SIZE = 100
+# 발행된 메시지를 남겨 두는 기간 (coalesce_key 중복 확인, 장애 추적용)
+OUTBOX_RETENTION = timedelta(days=1)
+
+
+def enqueue(task, args=(), kwargs=None, countdown=None, coalesce_key=None):
+    """
+    task 실행 요청을 현재 트랜잭션 안에서 아웃박스에 기록합니다.
+    트랜잭션이 롤백되면 요청도 함께 사라지고, 커밋되면 relay_outbox가 발행합니다.
+    coalesce_key가 같은 요청이 countdown초 안에 이미 기록되었다면 새로 기록하지 않습니다.
+    """
+    if coalesce_key is not None:
+        window_start = timezone.now() - timedelta(seconds=countdown or 0)
+        if OutboxMessage.objects.filter(
+            coalesce_key=coalesce_key, created_at__gte=window_start
+        ).exists():
+            return None
+    return OutboxMessage.objects.create(
+        task_name=task.name,
+        args=list(args),
+        kwargs=kwargs or {},
+        countdown=countdown,
+        coalesce_key=coalesce_key,
+    )
+
+
+def dispatch(task, args=(), kwargs=None, countdown=None):
+    """
+    커밋 후 공용 연결 풀로 task를 바로 발행하고, 브로커를 쓸 수 없으면 아웃박스에 기록합니다.
+    enqueue보다 지연이 짧은 대신, 커밋과 발행 사이에 프로세스가 죽으면 작업이 사라질 수 있습니다.
+    """
+
+    def send():
+        try:
+            publish(task, args, kwargs, countdown=countdown)
+        except BrokerUnavailable:
+            enqueue(task, args, kwargs, countdown=countdown)
+
+    transaction.on_commit(send)
+
+
+def relay_outbox(batch_size=OUTBOX_BATCH_SIZE):
+    """발행 대기 메시지를 오래된 순으로 batch_size개까지 발행하고 발행한 수를 반환"""
+    if not is_broker_available():
+        # 브로커 장애가 기록된 동안에는 행을 잠그지 않고 건너뜀
+        return 0
+    with transaction.atomic():
+        # 여러 릴레이가 동시에 돌아도 같은 메시지를 잡지 않도록 잠긴 행은 건너뜀
+        messages = list(
+            OutboxMessage.objects.select_for_update(skip_locked=True)
+            .filter(published_at__isnull=True)
+            .order_by("id")[:batch_size]
+        )
+        if not messages:
+            return 0
+
+        published = []
+        try:
+            with pooled_producer() as producer:
+                for message in messages:
+                    celery_app.send_task(
+                        message.task_name,
+                        args=message.args,
+                        kwargs=message.kwargs,
+                        countdown=message.countdown,
+                        producer=producer,
+                        retry=False,
+                        ignore_result=True,
+                    )
+                    message.published_at = timezone.now()
+                    published.append(message)
+        except BrokerUnavailable as e:
+            # 발행하지 못한 첫 메시지에 오류를 남기고 나머지는 다음 실행 때 다시 시도
+            failed = messages[len(published)]
+            failed.attempts += 1
+            failed.last_error = str(e)
+            published.append(failed)
+            logger.error(f"Failed to relay outbox message {failed.id}: {str(e)}")
+
+        OutboxMessage.objects.bulk_update(
+            published, ["published_at", "attempts", "last_error"]
+        )
+    return sum(1 for message in published if message.published_at)
+
+
+def purge_published_messages():
+    """보관 기간이 지난 발행 완료 메시지를 삭제하고 삭제한 수를 반환"""
+    deleted, _ = OutboxMessage.objects.filter(
+        published_at__lt=timezone.now() - OUTBOX_RETENTION
+    ).delete()
+    return deleted
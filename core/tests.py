@@ -1,3 +1,108 @@
+from unittest import mock
+from celery.exceptions import OperationalError
+from django.db import transaction
 from django.test import TestCase
+from companies.models import Company, CompanyMembership
+from companies.tasks import create_notification_for_new_member
+from users.models import User
+from .broker import BrokerUnavailable, publish
+from .models import OutboxMessage
+from .outbox import dispatch, relay_outbox
 
-# Create your tests here.
+
+class OutboxTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create(username="owner")
+        self.company = Company.objects.create(name="ocelot", owner=self.owner)
+
+    def join(self, username):
+        return CompanyMembership.objects.create(
+            company=self.company, user=User.objects.create(username=username)
+        )
+
+    def test_task_is_recorded_with_membership(self):
+        membership = self.join("member")
+
+        message = OutboxMessage.objects.get()
+        self.assertEqual(message.task_name, create_notification_for_new_member.name)
+        self.assertEqual(message.args, [self.company.id, membership.id])
+        self.assertIsNone(message.published_at)
+
+    def test_rolled_back_membership_leaves_no_task(self):
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            self.join("member")
+            raise RuntimeError
+
+        self.assertFalse(OutboxMessage.objects.exists())
+
+    @mock.patch("core.broker.celery_app")
+    @mock.patch("core.outbox.celery_app.send_task")
+    def test_relay_publishes_pending_messages_in_order(self, send_task, _):
+        first = self.join("first")
+        second = self.join("second")
+
+        self.assertEqual(relay_outbox(), 2)
+        self.assertEqual(relay_outbox(), 0)
+
+        self.assertEqual(
+            [call.kwargs["args"] for call in send_task.call_args_list],
+            [[self.company.id, first.id], [self.company.id, second.id]],
+        )
+        self.assertFalse(OutboxMessage.objects.filter(published_at=None).exists())
+
+    @mock.patch("core.broker._down_until", 0.0)
+    @mock.patch("core.broker.celery_app")
+    @mock.patch("core.outbox.celery_app.send_task")
+    def test_relay_keeps_messages_when_broker_is_down(self, send_task, _):
+        send_task.side_effect = ConnectionError("broker down")
+        self.join("member")
+
+        self.assertEqual(relay_outbox(), 0)
+        # 장애가 기록된 동안에는 발행을 시도하지 않음
+        self.assertEqual(relay_outbox(), 0)
+
+        send_task.assert_called_once()
+        message = OutboxMessage.objects.get()
+        self.assertIsNone(message.published_at)
+        self.assertEqual(message.attempts, 1)
+        self.assertEqual(message.last_error, "broker down")
+
+
+@mock.patch("core.broker._down_until", 0.0)
+class PooledPublishTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create(username="owner")
+        self.company = Company.objects.create(name="ocelot", owner=self.owner)
+
+    @mock.patch("core.broker.celery_app")
+    def test_publish_reuses_pooled_producer(self, celery_app):
+        task = mock.Mock()
+        producer = celery_app.producer_pool.acquire.return_value.__enter__.return_value
+
+        publish(task, (1,), countdown=5)
+
+        task.apply_async.assert_called_once_with(
+            (1,), None, producer=producer, retry=False, ignore_result=True, countdown=5
+        )
+
+    @mock.patch("core.broker.celery_app")
+    def test_broker_failure_short_circuits_later_publishes(self, celery_app):
+        celery_app.producer_pool.acquire.side_effect = OperationalError("refused")
+
+        with self.assertRaises(BrokerUnavailable):
+            publish(mock.Mock())
+        with self.assertRaises(BrokerUnavailable):
+            publish(mock.Mock())
+
+        celery_app.producer_pool.acquire.assert_called_once()
+
+    @mock.patch("core.broker.celery_app")
+    def test_dispatch_falls_back_to_outbox(self, celery_app):
+        celery_app.producer_pool.acquire.side_effect = OperationalError("refused")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            dispatch(create_notification_for_new_member, args=(self.company.id, 1))
+
+        message = OutboxMessage.objects.get()
+        self.assertEqual(message.task_name, create_notification_for_new_member.name)
+        self.assertEqual(message.args, [self.company.id, 1])
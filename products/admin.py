@@ -3,7 +3,7 @@ from django.contrib import admin
 from django.forms import ModelForm
 from companies.models import Notification
 from products.services import upload_image_to_cloudflare
-from .models import Product, ProductImage, ProductRecord
+from .models import ImageAsset, Product, ProductImage, ProductRecord
 
 
 class ProductImageForm(ModelForm):
@@ -83,6 +83,13 @@ class ProductRecordAdmin(admin.ModelAdmin):
         return super().get_queryset(request).select_related("product", "recorded_by")
 
 
+@admin.register(ImageAsset)
+class ImageAssetAdmin(admin.ModelAdmin):
+    list_display = ("content_hash", "image_url", "created_at")
+    search_fields = ("content_hash", "image_url")
+    readonly_fields = ("created_at",)
+
+
 # Notification 모델
 @admin.register(Notification)
 class NotificationAdmin(admin.ModelAdmin):
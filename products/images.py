@@ -0,0 +1,113 @@
+import multiprocessing
+import os
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from django.conf import settings
+from PIL import Image, ImageOps
+import logging
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPES = {"WEBP": "image/webp", "JPEG": "image/jpeg"}
+
+# 프로세스별 이미지 변환용 프로세스 풀 (fork 이후 자식 프로세스는 새로 만듦)
+_pool = None
+_pool_pid = None
+# 스레드 풀 워커(--pool=threads)의 여러 스레드가 동시에 풀을 만들지 않도록 보호
+_pool_lock = threading.Lock()
+
+
+def _save_image(image, image_format, quality):
+    if image_format == "JPEG" and image.mode != "RGB":
+        image = image.convert("RGB")
+    with tempfile.NamedTemporaryFile(
+        delete=False, suffix=f".{image_format.lower()}"
+    ) as temp_file:
+        image.save(temp_file, image_format, quality=quality)
+    return temp_file.name
+
+
+def normalize_image(temp_file_path, max_size, thumbnail_size, image_format, quality):
+    """
+    EXIF 방향을 적용하고 긴 변을 max_size로 줄여 image_format으로 다시 인코딩하고,
+    긴 변이 thumbnail_size인 썸네일도 만듭니다. (이미지 경로, 썸네일 경로)를 반환합니다.
+    프로세스 풀에서 실행되므로 Django 설정 대신 값을 인자로 받습니다.
+    """
+    with Image.open(temp_file_path) as image:
+        # JPEG은 디코딩 단계에서 미리 축소해 변환 시간을 줄임
+        image.draft("RGB", (max_size, max_size))
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "transparency" in image.info else "RGB")
+        image.thumbnail((max_size, max_size))
+        image_path = _save_image(image, image_format, quality)
+        image.thumbnail((thumbnail_size, thumbnail_size))
+        thumbnail_path = _save_image(image, image_format, quality)
+    return image_path, thumbnail_path
+
+
+def get_process_pool():
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            # 스레드 풀 워커 안에서 fork하지 않도록 spawn으로 시작
+            _pool = ProcessPoolExecutor(
+                max_workers=settings.IMAGE_PROCESS_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def _discard_pool(pool):
+    """쓸 수 없게 된 풀을 종료하고, 다음 요청 때 새로 만들도록 비움"""
+    global _pool
+    with _pool_lock:
+        # 다른 스레드가 이미 새 풀로 바꿨다면 그 풀은 그대로 둠
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _run_normalize(args):
+    """프로세스 풀에서 변환하고, 풀을 쓸 수 없으면 현재 프로세스에서 변환"""
+    if not settings.IMAGE_PROCESS_WORKERS:
+        return normalize_image(*args)
+    pool = get_process_pool()
+    try:
+        future = pool.submit(normalize_image, *args)
+    except Exception as e:
+        logger.warning(f"Image process pool unavailable: {str(e)}")
+        _discard_pool(pool)
+        return normalize_image(*args)
+    try:
+        return future.result()
+    except BrokenProcessPool as e:
+        # 변환 프로세스가 비정상 종료되면 다음 요청 때 풀을 새로 만듦
+        logger.warning(f"Image process pool broken: {str(e)}")
+        _discard_pool(pool)
+        return normalize_image(*args)
+
+
+def process_image(temp_file_path):
+    """
+    업로드 전 이미지를 정규화합니다. (이미지 경로, content_type, 썸네일 경로)를 반환하고,
+    이미지가 아니거나 변환에 실패하면 원본을 그대로 쓰고 content_type과 썸네일은 None입니다.
+    """
+    image_format = settings.IMAGE_FORMAT
+    try:
+        image_path, thumbnail_path = _run_normalize(
+            (
+                temp_file_path,
+                settings.IMAGE_MAX_SIZE,
+                settings.IMAGE_THUMBNAIL_SIZE,
+                image_format,
+                settings.IMAGE_QUALITY,
+            )
+        )
+    except Exception as e:
+        logger.warning(f"Failed to normalize image {temp_file_path}: {str(e)}")
+        return temp_file_path, None, None
+    return image_path, CONTENT_TYPES[image_format], thumbnail_path
@@ -0,0 +1,77 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import F, IntegerField, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from products.models import Product, ProductRecord
+
+
+class Command(BaseCommand):
+    """
+    기능 : 입출고 기록으로 Product.stock_pieces와 입고 기록의 remaining_pieces를 검증하고 다시 계산
+    배포 : 두 컬럼이 추가된 배포 직후 한 번만 `python manage.py rebuild_stock`으로 채웁니다.
+           이후에는 재고 변경마다 함께 갱신되므로 릴리스마다 실행하지 않고,
+           필요하면 CHECK_STOCK_ON_RELEASE를 설정해 릴리스 단계에서 --check로 검증만 합니다.
+    """
+
+    help = "입출고 기록으로부터 상품 재고 카운터를 검증하고 다시 계산합니다."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--product",
+            type=int,
+            action="append",
+            dest="product_ids",
+            help="대상 상품 ID (여러 번 지정 가능, 생략 시 전체)",
+        )
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="카운터를 수정하지 않고 불일치만 보고합니다.",
+        )
+
+    def handle(self, *args, **options):
+        ledger = (
+            ProductRecord.objects.filter(product=OuterRef("pk"), record_type="in")
+            .values("product")
+            .annotate(
+                total=Sum(
+                    ProductRecord.remaining_pieces_expression(
+                        OuterRef("pieces_per_box")
+                    )
+                )
+            )
+            .values("total")
+        )
+        # 남은 수량 컬럼이 기록과 어긋난 입고 기록이 있는 상품
+        stale_lots = ProductRecord.objects.filter(record_type="in").exclude(
+            remaining_pieces=ProductRecord.remaining_pieces_expression(
+                F("product__pieces_per_box")
+            )
+        )
+        products = Product.objects.annotate(
+            ledger_stock=Coalesce(
+                Subquery(ledger, output_field=IntegerField()), Value(0)
+            )
+        ).filter(
+            ~Q(stock_pieces=F("ledger_stock")) | Q(pk__in=stale_lots.values("product"))
+        )
+        if options["product_ids"]:
+            products = products.filter(pk__in=options["product_ids"])
+
+        drifted = 0
+        for product in products.iterator():
+            drifted += 1
+            self.stdout.write(
+                f"상품 {product.pk} ({product.name}): "
+                f"카운터 {product.stock_pieces}, 기록 {product.ledger_stock}"
+            )
+            if not options["check"]:
+                product.rebuild_stock()
+
+        if options["check"]:
+            if drifted:
+                raise CommandError(f"재고 카운터 불일치 상품 {drifted}개")
+            self.stdout.write(self.style.SUCCESS("모든 재고 카운터가 일치합니다."))
+        else:
+            self.stdout.write(
+                self.style.SUCCESS(f"재고 카운터 {drifted}개를 다시 계산했습니다.")
+            )
@@ -1,10 +1,16 @@
+from datetime import datetime, time, timedelta
 from django.db import models, transaction
-from django.db.models import Sum, F
+from django.db.models import Case, IntegerField, Sum, F, Q, When
 from django.core.validators import MinValueValidator
 from core.models import CommonModel
 from users.models import User
-from django.db.transaction import on_commit
 from django.urls import reverse
+from django.utils import timezone
+
+
+def start_of_local_day(day):
+    """현지 시간대 기준 day 자정의 aware datetime"""
+    return timezone.make_aware(datetime.combine(day, time.min))
 
 
 class Product(CommonModel):
@@ -55,20 +61,38 @@ class Product(CommonModel):
         default="pending",
         help_text="Image upload status",
     )
+    stock_pieces = models.IntegerField(
+        default=0, editable=False, help_text="현재 재고 총 개수 (입출고 시 갱신)"
+    )
 
     def save(self, *args, **kwargs):
         is_new = self._state.adding
         if self.unit == "count":
             self.quantity = 1
-        super().save(*args, **kwargs)
-        if is_new:
-            from companies.tasks import create_notification_for_new_product
-
-            on_commit(
-                lambda: create_notification_for_new_product.delay(
-                    self.company_id, self.id
-                )
+        pieces_per_box_changed = False
+        if not is_new:
+            pieces_per_box_changed = (
+                Product.objects.filter(pk=self.pk)
+                .exclude(pieces_per_box=self.pieces_per_box)
+                .exists()
             )
+            if kwargs.get("update_fields") is None:
+                # 재고 카운터는 입출고 기록에서만 갱신하므로 덮어쓰지 않음
+                kwargs["update_fields"] = [
+                    field.name
+                    for field in self._meta.concrete_fields
+                    if not field.primary_key and field.name != "stock_pieces"
+                ]
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if pieces_per_box_changed:
+                # 박스 단위 입고 수량이 달라지므로 기록으로부터 재계산
+                self.rebuild_stock()
+            if is_new:
+                from companies.tasks import queue_new_product_notification
+
+                # 상품과 같은 트랜잭션에서 아웃박스에 기록
+                queue_new_product_notification(self.company_id, self.id)
 
     class Meta:
         indexes = [
@@ -87,31 +111,115 @@ class Product(CommonModel):
         return f"http://127.0.0.1:8000/api/v1/products/{self.id}"
 
     def get_total_stock(self):
-        result = self.records.filter(record_type="in").aggregate(
-            total_pieces=Sum(
-                (F("box_quantity") * self.pieces_per_box)
-                + F("piece_quantity")
-                - F("consumed_quantity")
+        return self._split_pieces(self.stock_pieces)
+
+    def get_stock_at(self, at):
+        """at 시점의 재고: 가장 가까운 이전 일자 스냅샷 + 그 이후 입출고"""
+        snapshot = (
+            self.stock_snapshots.filter(snapshot_date__lt=timezone.localdate(at))
+            .order_by("-snapshot_date")
+            .first()
+        )
+        records = self.records.filter(record_date__lte=at)
+        total_pieces = 0
+        if snapshot:
+            records = records.filter(
+                record_date__gte=start_of_local_day(
+                    snapshot.snapshot_date + timedelta(days=1)
+                )
             )
+            total_pieces = snapshot.stock_pieces
+        result = records.aggregate(
+            pieces=Sum(ProductRecord.movement_pieces_expression(self.pieces_per_box))
         )
-        total_pieces = result["total_pieces"] or 0
+        total_pieces += result["pieces"] or 0
+        return {
+            **self._split_pieces(total_pieces),
+            "snapshot_date": snapshot.snapshot_date if snapshot else None,
+        }
+
+    def _split_pieces(self, total_pieces):
         return {
             "box_quantity": total_pieces // self.pieces_per_box,
             "piece_quantity": total_pieces % self.pieces_per_box,
             "total_pieces": total_pieces,
         }
 
+    def get_ledger_stock(self):
+        """입출고 기록으로부터 재고 총 개수를 직접 집계"""
+        result = self.records.filter(record_type="in").aggregate(
+            total_pieces=Sum(
+                ProductRecord.remaining_pieces_expression(self.pieces_per_box)
+            )
+        )
+        return result["total_pieces"] or 0
+
+    def rebuild_stock(self):
+        """재고 카운터를 입출고 기록 기준으로 다시 맞추고 이전 값과의 차이를 반환"""
+        with transaction.atomic():
+            previous = (
+                Product.objects.select_for_update(no_key=True)
+                .values_list("stock_pieces", flat=True)
+                .get(pk=self.pk)
+            )
+            # 입고 기록의 남은 수량도 현재 박스 입수 기준으로 맞춤
+            remaining_pieces = ProductRecord.remaining_pieces_expression(
+                self.pieces_per_box
+            )
+            self.records.filter(record_type="in").exclude(
+                remaining_pieces=remaining_pieces
+            ).update(remaining_pieces=remaining_pieces)
+            self.stock_pieces = self.get_ledger_stock()
+            Product.objects.filter(pk=self.pk).update(stock_pieces=self.stock_pieces)
+        return self.stock_pieces - previous
+
+    def adjust_stock(self, pieces):
+        """재고 카운터를 pieces만큼 원자적으로 증감"""
+        Product.objects.filter(pk=self.pk).update(
+            stock_pieces=F("stock_pieces") + pieces
+        )
+        self.stock_pieces += pieces
+
 
 class ProductImage(models.Model):
     product = models.ForeignKey(
         Product, on_delete=models.CASCADE, related_name="images"
     )
     image_url = models.URLField(max_length=999)
+    thumbnail_url = models.URLField(max_length=999, null=True, blank=True)
 
     def __str__(self):
         return f"Image for {self.product.name} ({self.image_url})"
 
 
+class ImageAsset(models.Model):
+    """
+    업로드한 원본 이미지의 SHA-256과 전달 URL.
+    같은 사진이 다시 올라오면 업로드하지 않고 이 URL을 재사용합니다.
+    """
+
+    content_hash = models.CharField(max_length=64, unique=True)
+    image_url = models.URLField(max_length=999)
+    thumbnail_url = models.URLField(max_length=999, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.content_hash[:12]} ({self.image_url})"
+
+
+class ProductRecordQuerySet(models.QuerySet):
+    def delete(self):
+        """일괄 삭제(관리자 화면의 선택 삭제 등)에서도 입고 기록이 지워진 상품의 재고를 다시 계산"""
+        with transaction.atomic():
+            product_ids = set(
+                self.filter(record_type="in").values_list("product_id", flat=True)
+            )
+            result = super().delete()
+            for product in Product.objects.filter(pk__in=product_ids):
+                product.rebuild_stock()
+        return result
+
+
 class ProductRecord(models.Model):
     RECORD_TYPE_CHOICES = (
         ("in", "입고"),
@@ -126,54 +234,152 @@ class ProductRecord(models.Model):
     consumed_quantity = models.IntegerField(
         default=0, validators=[MinValueValidator(0)]
     )  # 소진된 수량
+    remaining_pieces = models.IntegerField(default=0, editable=False)  # 남은 수량
     recorded_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
     record_date = models.DateTimeField(auto_now_add=True)
     expiration_date = models.DateTimeField(null=True, blank=True)
 
+    objects = ProductRecordQuerySet.as_manager()
+
     class Meta:
         indexes = [
             models.Index(fields=["record_date"]),
             models.Index(fields=["record_type"]),
             models.Index(fields=["expiration_date"]),
+            # 상품별 기록 이력 커서 페이지네이션용
+            models.Index(fields=["product", "record_date", "id"]),
+            # 남은 재고가 있는 입고 기록만 담는 부분 인덱스 (FIFO 조회용)
+            models.Index(
+                fields=["product", "record_date"],
+                name="productrecord_open_lot_idx",
+                condition=Q(record_type="in", remaining_pieces__gt=0),
+            ),
+            # 남은 재고가 있는 입고 기록의 유통기한 범위 조회용
+            models.Index(
+                fields=["expiration_date"],
+                name="productrecord_expiring_idx",
+                condition=Q(record_type="in", remaining_pieces__gt=0),
+            ),
         ]
 
+    @staticmethod
+    def remaining_pieces_expression(pieces_per_box):
+        return (
+            F("box_quantity") * pieces_per_box
+            + F("piece_quantity")
+            - F("consumed_quantity")
+        )
+
+    @staticmethod
+    def movement_pieces_expression(pieces_per_box):
+        """입고는 +, 출고는 - 로 부호를 붙인 기록의 총 개수"""
+        pieces = F("box_quantity") * pieces_per_box + F("piece_quantity")
+        return Case(
+            When(record_type="in", then=pieces),
+            default=pieces * -1,
+            output_field=IntegerField(),
+        )
+
+    def get_total_pieces(self):
+        return (self.box_quantity * self.product.pieces_per_box) + self.piece_quantity
+
     def save(self, *args, **kwargs):
         is_new = self._state.adding
+        if "update_fields" not in kwargs:
+            if self.record_type == "in":
+                self.remaining_pieces = self.get_total_pieces() - self.consumed_quantity
+            else:
+                self.remaining_pieces = 0
         with transaction.atomic():
             super().save(*args, **kwargs)
-            if is_new and self.record_type == "out":
+            if is_new and self.record_type == "in":
+                self.product.adjust_stock(self.get_total_pieces())
+            elif is_new and self.record_type == "out":
                 self._consume_stock()
+            elif not is_new and "update_fields" not in kwargs:
+                # 기존 기록 수정(관리자 화면 등)은 수량 변화를 알 수 없으므로 재집계
+                self.product.rebuild_stock()
+
+    @classmethod
+    def bulk_ingest(cls, records):
+        """입고 기록은 bulk_create로 한 번에 저장하고, 출고 기록은 상품별 FIFO로 소진
+
+        (record, error) 목록을 입력 순서대로 반환하며, 재고가 부족한 출고는
+        해당 기록만 저장되지 않습니다.
+        """
+        in_records = [record for record in records if record.record_type == "in"]
+        for record in in_records:
+            record.remaining_pieces = record.get_total_pieces()
+
+        errors = {}
+        with transaction.atomic():
+            cls.objects.bulk_create(in_records)
+
+            indexes_by_product = {}
+            for index, record in enumerate(records):
+                indexes_by_product.setdefault(record.product_id, []).append(index)
+
+            # 상품 ID 순으로 잠가 동시에 들어온 일괄 요청끼리 교착되지 않도록 함
+            for product_id in sorted(indexes_by_product):
+                product_records = [
+                    records[index] for index in indexes_by_product[product_id]
+                ]
+                received = sum(
+                    record.get_total_pieces()
+                    for record in product_records
+                    if record.record_type == "in"
+                )
+                if received:
+                    product_records[0].product.adjust_stock(received)
+                for index in indexes_by_product[product_id]:
+                    record = records[index]
+                    if record.record_type != "out":
+                        continue
+                    try:
+                        record.save()
+                    except ValueError as exc:
+                        record.pk = None
+                        errors[index] = str(exc)
+
+        return [(record, errors.get(index)) for index, record in enumerate(records)]
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            result = super().delete(*args, **kwargs)
+            if self.record_type == "in":
+                self.product.rebuild_stock()
+        return result
 
     def _consume_stock(self):
         """출고 시 FIFO로 재고 소진"""
-        total_out_pieces = (
-            self.box_quantity * self.product.pieces_per_box
-        ) + self.piece_quantity
+        total_out_pieces = self.get_total_pieces()
         if total_out_pieces <= 0:
             return
 
+        # 상품 행을 먼저 잠가 같은 상품의 출고만 직렬화 (다른 상품은 서로 막지 않음)
+        # 기록 INSERT가 외래 키로 잡는 FOR KEY SHARE와 충돌하지 않도록 FOR NO KEY UPDATE
+        (
+            Product.objects.select_for_update(no_key=True)
+            .filter(pk=self.product_id)
+            .values_list("pk", flat=True)
+            .get()
+        )
+
+        # 열린 입고 기록을 한 번에 잠금 조회한 뒤 할당 결과를 일괄 반영
         in_records = (
-            self.product.records.filter(record_type="in")
-            .exclude(
-                consumed_quantity=F("box_quantity") * self.product.pieces_per_box
-                + F("piece_quantity")
-            )
-            .order_by("record_date")
+            self.product.records.select_for_update()
+            .filter(record_type="in", remaining_pieces__gt=0)
+            .order_by("record_date", "id")
+            .only("id", "product", "consumed_quantity", "remaining_pieces")
         )
 
         remaining_out = total_out_pieces
+        consumed_records = []
         for in_record in in_records:
-            available_pieces = (
-                (in_record.box_quantity * self.product.pieces_per_box)
-                + in_record.piece_quantity
-                - in_record.consumed_quantity
-            )
-            if available_pieces <= 0:
-                continue
-
-            consumed = min(available_pieces, remaining_out)
+            consumed = min(in_record.remaining_pieces, remaining_out)
             in_record.consumed_quantity += consumed
-            in_record.save(update_fields=["consumed_quantity"])
+            in_record.remaining_pieces -= consumed
+            consumed_records.append(in_record)
             remaining_out -= consumed
 
             if remaining_out <= 0:
@@ -182,5 +388,25 @@ class ProductRecord(models.Model):
         if remaining_out > 0:
             raise ValueError("소진할 재고가 부족합니다.")
 
+        ProductRecord.objects.bulk_update(
+            consumed_records, ["consumed_quantity", "remaining_pieces"]
+        )
+        self.product.adjust_stock(-total_out_pieces)
+
     def __str__(self):
         return f"{self.get_record_type_display()} - {self.product.name}"
+
+
+class ProductStockSnapshot(models.Model):
+    product = models.ForeignKey(
+        Product, on_delete=models.CASCADE, related_name="stock_snapshots"
+    )
+    snapshot_date = models.DateField(help_text="해당 일자 마감 기준")
+    stock_pieces = models.IntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ("product", "snapshot_date")
+
+    def __str__(self):
+        return f"{self.product.name} - {self.snapshot_date} ({self.stock_pieces})"
@@ -0,0 +1,29 @@
+import csv
+import io
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+
+def parse_csv(content, encoding="utf-8"):
+    """CSV를 헤더 기준 dict 목록으로 변환 (빈 칸은 생략해 기본값이 적용되도록 함)"""
+    if isinstance(content, bytes):
+        try:
+            # 엑셀에서 저장한 파일의 BOM 제거
+            content = content.decode("utf-8-sig" if encoding == "utf-8" else encoding)
+        except UnicodeDecodeError:
+            raise ParseError("CSV 파일의 인코딩을 읽을 수 없습니다.")
+    reader = csv.DictReader(io.StringIO(content))
+    return [
+        {key: value for key, value in row.items() if key and value not in ("", None)}
+        for row in reader
+    ]
+
+
+class CSVParser(BaseParser):
+    media_type = "text/csv"
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get("encoding", settings.DEFAULT_CHARSET)
+        return parse_csv(stream.read(), encoding=encoding.lower())
@@ -1,9 +1,11 @@
+import hashlib
 import tempfile
 from dateutil.relativedelta import relativedelta
 from django.utils import timezone
 from rest_framework import serializers
 from companies.models import Company
-from .tasks import upload_image_to_cloudflare_task
+from core.outbox import dispatch
+from .tasks import upload_product_images_task
 from .models import Product, ProductImage, ProductRecord
 import logging
 
@@ -16,6 +18,7 @@ class ProductSerializer(serializers.ModelSerializer):
         child=serializers.ImageField(), write_only=True, required=False
     )
     image_urls = serializers.SerializerMethodField(read_only=True)
+    thumbnail_urls = serializers.SerializerMethodField(read_only=True)
     image_upload_status = serializers.CharField(read_only=True)
     company = serializers.PrimaryKeyRelatedField(
         queryset=Company.objects.all(), required=False
@@ -34,6 +37,7 @@ class ProductSerializer(serializers.ModelSerializer):
             "quantity",
             "images",
             "image_urls",
+            "thumbnail_urls",
             "image_upload_status",
             "current_stock",
         ]
@@ -44,6 +48,9 @@ class ProductSerializer(serializers.ModelSerializer):
     def get_image_urls(self, obj):
         return [image.image_url for image in obj.images.all()]
 
+    def get_thumbnail_urls(self, obj):
+        return [image.thumbnail_url or image.image_url for image in obj.images.all()]
+
     def validate(self, data):
         unit = data.get("unit")
         quantity = data.get("quantity")
@@ -62,30 +69,37 @@ class ProductSerializer(serializers.ModelSerializer):
         logger.info(f"Received {len(images_data)} images for product creation via API")
         product = Product.objects.create(**validated_data)
 
-        for image_file in images_data:
-            try:
+        if not images_data:
+            return product
+        try:
+            files = []
+            for image_file in images_data:
+                # 임시 파일에 쓰면서 중복 업로드 확인용 해시도 계산
+                content_hash = hashlib.sha256()
                 with tempfile.NamedTemporaryFile(
                     delete=False, suffix=".jpg"
                 ) as temp_file:
                     for chunk in image_file.chunks():
                         temp_file.write(chunk)
-                    temp_file_path = temp_file.name
-                logger.info(
-                    f"Scheduling image upload task for product {product.id} with file {temp_file_path}, content_type: {image_file.content_type}"
-                )
-                upload_image_to_cloudflare_task.delay(
-                    temp_file_path, product.id, content_type=image_file.content_type
-                )
-            except Exception as e:
-                logger.error(
-                    f"Failed to schedule image upload for product {product.id}: {str(e)}"
-                )
-                product.image_upload_status = "failed"
-                ProductImage.objects.filter(product=product).delete()
-                ProductImage.objects.create(
-                    product=product, image_url="https://picsum.photos/1000"
+                        content_hash.update(chunk)
+                files.append(
+                    [temp_file.name, image_file.content_type, content_hash.hexdigest()]
                 )
-                product.save()
+            logger.info(
+                f"Scheduling upload of {len(files)} images for product {product.id}"
+            )
+            # 브로커 장애 시에는 아웃박스에 기록되어 복구 후 발행됨
+            dispatch(upload_product_images_task, args=(product.id, files))
+        except Exception as e:
+            logger.error(
+                f"Failed to schedule image upload for product {product.id}: {str(e)}"
+            )
+            product.image_upload_status = "failed"
+            ProductImage.objects.filter(product=product).delete()
+            ProductImage.objects.create(
+                product=product, image_url="https://picsum.photos/1000"
+            )
+            product.save()
 
         return product
 
@@ -126,3 +140,55 @@ class ProductRecordSerializer(serializers.ModelSerializer):
             )
         record.save()
         return record
+
+
+class ExpiringLotSerializer(serializers.ModelSerializer):
+    product_name = serializers.CharField(source="product.name", read_only=True)
+
+    class Meta:
+        model = ProductRecord
+        fields = [
+            "id",
+            "product",
+            "product_name",
+            "remaining_pieces",
+            "record_date",
+            "expiration_date",
+        ]
+
+
+class ProductRecordBulkListSerializer(serializers.ListSerializer):
+    def create(self, validated_data):
+        record_date = timezone.now()
+        records = []
+        for attrs in validated_data:
+            record = ProductRecord(record_date=record_date, **attrs)
+            if record.record_type == "in":
+                record.expiration_date = record_date + relativedelta(
+                    months=record.product.storage_months
+                )
+            records.append(record)
+        return ProductRecord.bulk_ingest(records)
+
+
+class ProductRecordBulkItemSerializer(serializers.Serializer):
+    """
+    일괄 입출고 요청의 한 행. 상품은 context["products"]에서 미리 조회된 것을 사용하고,
+    context["company_ids"](사용자가 소속된 회사)의 상품만 허용합니다.
+    """
+
+    product = serializers.IntegerField()
+    record_type = serializers.ChoiceField(choices=ProductRecord.RECORD_TYPE_CHOICES)
+    piece_quantity = serializers.IntegerField(min_value=0, default=0)
+    box_quantity = serializers.IntegerField(min_value=0, default=0)
+
+    class Meta:
+        list_serializer_class = ProductRecordBulkListSerializer
+
+    def validate_product(self, value):
+        product = self.context["products"].get(value)
+        if product is None:
+            raise serializers.ValidationError("존재하지 않는 상품입니다.")
+        if product.company_id not in self.context["company_ids"]:
+            raise serializers.ValidationError("소속된 회사의 상품이 아닙니다.")
+        return product
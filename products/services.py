@@ -1,27 +1,220 @@
+import os
+import time
+import uuid
 import requests
+from requests.adapters import HTTPAdapter
 from django.conf import settings
+from django.core.cache import cache
 from rest_framework.exceptions import APIException
 import logging
 
 logger = logging.getLogger(__name__)
 
+# 프로세스별 이미지 서비스 세션 (fork 이후 자식 프로세스는 새로 만듦)
+_session = None
+_session_pid = None
+
+
+def get_image_session():
+    """keep-alive 연결을 재사용하는 이미지 서비스용 세션"""
+    global _session, _session_pid
+    if _session is None or _session_pid != os.getpid():
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=settings.CLOUDFLARE_POOL_SIZE,
+            max_retries=0,
+        )
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        _session = session
+        _session_pid = os.getpid()
+    return _session
+
+
+class MultipartFileBody:
+    """
+    파일 하나를 multipart/form-data로 보내는 읽기 전용 본문.
+    전체를 메모리에 올리지 않고 read()로 조금씩 보내며, 길이를 알려 Content-Length를 씁니다.
+    """
+
+    def __init__(self, field_name, file, filename, content_type):
+        self.boundary = uuid.uuid4().hex
+        self.content_type = f"multipart/form-data; boundary={self.boundary}"
+        head = (
+            f"--{self.boundary}\r\n"
+            f'Content-Disposition: form-data; name="{field_name}"; '
+            f'filename="{filename}"\r\n'
+            f"Content-Type: {content_type}\r\n\r\n"
+        ).encode()
+        tail = f"\r\n--{self.boundary}--\r\n".encode()
+        start = file.tell()
+        file.seek(0, os.SEEK_END)
+        file_size = file.tell() - start
+        file.seek(start)
+        self.length = len(head) + file_size + len(tail)
+        self._parts = [_BytesPart(head), file, _BytesPart(tail)]
+
+    def __len__(self):
+        return self.length
+
+    def read(self, size=-1):
+        chunks = []
+        while self._parts and (size < 0 or size > 0):
+            chunk = self._parts[0].read(size)
+            if not chunk:
+                self._parts.pop(0)
+                continue
+            chunks.append(chunk)
+            if size > 0:
+                size -= len(chunk)
+        return b"".join(chunks)
+
+
+class _BytesPart:
+    def __init__(self, data):
+        self.data = data
+        self.offset = 0
+
+    def read(self, size=-1):
+        end = len(self.data) if size < 0 else self.offset + size
+        chunk = self.data[self.offset : end]
+        self.offset += len(chunk)
+        return chunk
+
+
+class CircuitOpenError(Exception):
+    def __init__(self, name, retry_after):
+        self.retry_after = retry_after
+        super().__init__(f"Circuit {name} is open, retry after {retry_after:.0f}s")
+
+
+class ImageRejectedError(APIException):
+    """이미지 서비스가 요청 자체를 거절(429 외의 4xx). 다시 보내도 같은 결과라 재시도하지 않음"""
+
+
+class CircuitBreaker:
+    """
+    캐시에 상태를 두어 모든 워커 프로세스가 함께 쓰는 서킷 브레이커.
+    연속 실패가 failure_threshold번이면 열리고, reset_timeout초 뒤 시험 요청 하나만 통과시켜
+    성공하면 닫히고 실패하면 다시 열립니다.
+    """
+
+    def __init__(self, name, failure_threshold, reset_timeout):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+    def _key(self, suffix):
+        return f"circuit:{self.name}:{suffix}"
+
+    def retry_after(self):
+        """열려 있으면 시험 요청이 가능해질 때까지 남은 시간(초), 아니면 0"""
+        opened_at = cache.get(self._key("opened_at"))
+        if opened_at is None:
+            return 0
+        return max(0, opened_at + self.reset_timeout - time.time())
+
+    def before_request(self):
+        opened_at = cache.get(self._key("opened_at"))
+        if opened_at is None:
+            return
+        retry_after = opened_at + self.reset_timeout - time.time()
+        if retry_after > 0:
+            raise CircuitOpenError(self.name, retry_after)
+        # 열린 뒤 reset_timeout이 지났으면 한 워커만 시험 요청을 보내고,
+        # 나머지는 시험 결과를 기다리지 않고 각자의 재시도 간격을 따름
+        if not cache.add(self._key("trial"), 1, self.reset_timeout):
+            raise CircuitOpenError(self.name, 0)
+
+    def record_success(self):
+        if cache.get(self._key("opened_at")) is not None:
+            logger.info(f"Circuit {self.name} closed")
+        cache.delete_many(
+            [self._key("failures"), self._key("opened_at"), self._key("trial")]
+        )
+
+    def record_failure(self):
+        if cache.get(self._key("opened_at")) is not None:
+            # 시험 요청이 실패하면 다시 reset_timeout 동안 열어 둠
+            cache.set(self._key("opened_at"), time.time(), None)
+            cache.delete(self._key("trial"))
+            logger.warning(f"Circuit {self.name} reopened after failed trial request")
+            return
+        key = self._key("failures")
+        cache.add(key, 0, self.reset_timeout)
+        failures = cache.incr(key)
+        if failures >= self.failure_threshold:
+            cache.set(self._key("opened_at"), time.time(), None)
+            cache.delete(self._key("trial"))
+            logger.warning(
+                f"Circuit {self.name} opened after {failures} consecutive failures"
+            )
+
+    def get_state(self):
+        retry_after = self.retry_after()
+        opened_at = cache.get(self._key("opened_at"))
+        if opened_at is None:
+            state = "closed"
+        elif retry_after > 0:
+            state = "open"
+        else:
+            state = "half_open"
+        return {
+            "name": self.name,
+            "state": state,
+            "failures": cache.get(self._key("failures"), 0),
+            "failure_threshold": self.failure_threshold,
+            "retry_after": round(retry_after, 1),
+        }
+
+
+image_service_breaker = CircuitBreaker(
+    "cloudflare_images",
+    failure_threshold=settings.CLOUDFLARE_CIRCUIT_FAILURE_THRESHOLD,
+    reset_timeout=settings.CLOUDFLARE_CIRCUIT_RESET_TIMEOUT,
+)
+
 
 def upload_image_to_cloudflare(image_file, content_type=None):
     try:
         if not content_type:
             content_type = "image/jpeg"
         url = settings.CLOUDFLARE_IMAGES_URL
+        body = MultipartFileBody(
+            "file",
+            image_file,
+            os.path.basename(getattr(image_file, "name", "image.jpg")),
+            content_type,
+        )
         headers = {
             "Authorization": f"Bearer {settings.CLOUDFLARE_API_TOKEN}",
+            "Content-Type": body.content_type,
         }
-        files = {
-            "file": (getattr(image_file, "name", "image.jpg"), image_file, content_type)
-        }
-        response = requests.post(url, headers=headers, files=files)
-        if response.status_code != 200:
-            raise APIException(
-                f"Cloudflare upload failed: {response.json().get('errors', 'Unknown error')}"
+        image_service_breaker.before_request()
+        try:
+            response = get_image_session().post(
+                url,
+                headers=headers,
+                data=body,
+                timeout=(
+                    settings.CLOUDFLARE_CONNECT_TIMEOUT,
+                    settings.CLOUDFLARE_READ_TIMEOUT,
+                ),
             )
+        except requests.RequestException:
+            image_service_breaker.record_failure()
+            raise
+        # 요청 자체의 문제(4xx)는 이미지 서비스 장애로 보지 않음
+        if response.status_code >= 500 or response.status_code == 429:
+            image_service_breaker.record_failure()
+        else:
+            image_service_breaker.record_success()
+        if response.status_code != 200:
+            message = f"Cloudflare upload failed: {response.json().get('errors', 'Unknown error')}"
+            if 400 <= response.status_code < 500 and response.status_code != 429:
+                raise ImageRejectedError(message)
+            raise APIException(message)
         result = response.json()
         if not result.get("success"):
             raise APIException("Cloudflare upload failed")
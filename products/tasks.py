@@ -1,6 +1,25 @@
+import hashlib
+import math
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date, timedelta
 from celery import shared_task
-from products.models import Product, ProductImage
-from products.services import upload_image_to_cloudflare
+from celery.utils.time import get_exponential_backoff_interval
+from django.db import transaction
+from django.db.models import F, OuterRef, Subquery, Sum
+from products.models import (
+    ImageAsset,
+    Product,
+    ProductImage,
+    ProductRecord,
+    ProductStockSnapshot,
+    start_of_local_day,
+)
+from products.images import process_image
+from products.services import (
+    CircuitOpenError,
+    ImageRejectedError,
+    upload_image_to_cloudflare,
+)
 import os
 import logging
 from django.utils import timezone
@@ -8,73 +27,306 @@ from django.utils import timezone
 logger = logging.getLogger(__name__)
 
 
-@shared_task(bind=True, max_retries=3)
-def upload_image_to_cloudflare_task(
-    self, temp_file_path, product_id, content_type=None
-):
-    logger.info(
-        f"Task attempt {self.request.retries + 1}/{self.max_retries + 1} for product {product_id} with file {temp_file_path}, content_type: {content_type}"
-    )
+# 업로드 재시도 간격: 30초부터 두 배씩, 최대 30분 (full jitter)
+IMAGE_UPLOAD_BACKOFF = 30
+IMAGE_UPLOAD_BACKOFF_MAX = 30 * 60
+# 한 상품의 이미지를 동시에 올리는 최대 개수
+IMAGE_UPLOAD_CONCURRENCY = 4
+DEFAULT_IMAGE_URL = "https://picsum.photos/1000"
+
+
+def _remove_temp_file(temp_file_path):
+    if not os.path.exists(temp_file_path):
+        return
+    try:
+        os.remove(temp_file_path)
+        logger.info(f"Temporary file {temp_file_path} deleted")
+    except Exception as e:
+        logger.error(f"Failed to delete temporary file {temp_file_path}: {str(e)}")
+
+
+def _content_hash(temp_file_path):
+    """해시 없이 발행된 작업용. 임시 파일의 SHA-256 (읽을 수 없으면 None)"""
+    content_hash = hashlib.sha256()
     try:
-        product = Product.objects.get(id=product_id)
-        with open(temp_file_path, "rb") as image_file:
+        with open(temp_file_path, "rb") as temp_file:
+            while chunk := temp_file.read(64 * 1024):
+                content_hash.update(chunk)
+    except OSError:
+        return None
+    return content_hash.hexdigest()
+
+
+def _upload_temp_file(temp_file_path, content_type):
+    """정규화한 이미지와 썸네일을 올리고 [이미지 URL, 썸네일 URL]을 반환"""
+    image_path, image_content_type, thumbnail_path = process_image(temp_file_path)
+    try:
+        with open(image_path, "rb") as image_file:
             image_url = upload_image_to_cloudflare(
-                image_file, content_type=content_type
+                image_file, content_type=image_content_type or content_type
             )
-        ProductImage.objects.filter(product=product).delete()
-        ProductImage.objects.create(product=product, image_url=image_url)
-        product.image_upload_status = "completed"
-        product.save()
-        logger.info(f"Image uploaded for product {product_id}: {image_url}")
-    except Product.DoesNotExist as exc:
-        logger.error(f"Product {product_id} not found: {str(exc)}")
-        if self.request.retries < self.max_retries:
-            logger.info(f"Retrying image upload task for product {product_id}")
-            self.retry(countdown=10, exc=exc)
+        thumbnail_url = None
+        if thumbnail_path:
+            with open(thumbnail_path, "rb") as thumbnail_file:
+                thumbnail_url = upload_image_to_cloudflare(
+                    thumbnail_file, content_type=image_content_type
+                )
+    finally:
+        for path in (image_path, thumbnail_path):
+            if path and path != temp_file_path:
+                _remove_temp_file(path)
+    return [image_url, thumbnail_url]
+
+
+# 업로드 중 워커가 죽어도 작업이 사라지지 않도록 완료 후 ack
+@shared_task(bind=True, max_retries=6, acks_late=True)
+def upload_product_images_task(self, product_id, files, uploaded=None):
+    """
+    상품 이미지 여러 장([임시 파일 경로, content_type, SHA-256] 목록)을 정규화해 썸네일과 함께 동시에 올리고,
+    모두 끝나면 ProductImage를 한 번에 생성하고 업로드 상태를 한 번만 바꿉니다.
+    실패한 이미지만 재시도하며, 이미 올린 이미지의 URL은 uploaded로 넘겨 유지합니다.
+    이미지 서비스가 거절(429 외의 4xx)한 이미지는 재시도하지 않고 제외합니다.
+    이전에 올린 적 있는 이미지(같은 해시의 ImageAsset)는 업로드하지 않고 URL을 재사용합니다.
+    """
+    uploaded = dict(uploaded or {})
+    pending = [file for file in files if file[0] not in uploaded]
+    logger.info(
+        f"Task attempt {self.request.retries + 1}/{self.max_retries + 1} for product {product_id}: uploading {len(pending)} of {len(files)} images"
+    )
+    status = (
+        Product.objects.filter(id=product_id)
+        .values_list("image_upload_status", flat=True)
+        .first()
+    )
+    if status != "pending":
+        # 완료 후 ack 전에 워커가 죽어 다시 전달된 작업은 아무것도 하지 않음
+        if status is None:
+            logger.error(f"Product {product_id} not found, discarding its images")
         else:
-            logger.error(
-                f"Failed to upload image for product {product_id}: Product does not exist"
-            )
-    except Exception as exc:
-        logger.error(f"Async image upload failed for product {product_id}: {str(exc)}")
-        if self.request.retries >= self.max_retries:
+            logger.info(f"Images for product {product_id} already {status}, skipping")
+        for temp_file_path, *_ in files:
+            _remove_temp_file(temp_file_path)
+        return 0
+
+    # 내용이 같은 이미지는 묶어서 한 번만 올림 (해시를 모르면 파일마다 따로)
+    groups = {}
+    for temp_file_path, content_type, *rest in pending:
+        content_hash = rest[0] if rest else _content_hash(temp_file_path)
+        key = content_hash or temp_file_path
+        groups.setdefault(key, (content_hash, []))[1].append(
+            (temp_file_path, content_type)
+        )
+    # 이전에 올린 적 있는 이미지는 업로드 없이 URL을 재사용
+    reused = 0
+    for asset in ImageAsset.objects.filter(content_hash__in=list(groups)):
+        for temp_file_path, _ in groups.pop(asset.content_hash)[1]:
+            uploaded[temp_file_path] = [asset.image_url, asset.thumbnail_url]
+            _remove_temp_file(temp_file_path)
+            reused += 1
+    if reused:
+        logger.info(
+            f"Reused {reused} previously uploaded images for product {product_id}"
+        )
+
+    errors = []
+    assets = []
+    with ThreadPoolExecutor(max_workers=IMAGE_UPLOAD_CONCURRENCY) as executor:
+        futures = {
+            executor.submit(_upload_temp_file, *group[0]): (content_hash, group)
+            for content_hash, group in groups.values()
+        }
+        for future in as_completed(futures):
+            content_hash, group = futures[future]
             try:
-                logger.info(
-                    f"Switching to synchronous upload for product {product_id} at {timezone.now()}"
-                )
-                with open(temp_file_path, "rb") as image_file:
-                    image_url = upload_image_to_cloudflare(
-                        image_file, content_type=content_type
-                    )
-                product = Product.objects.get(id=product_id)
-                ProductImage.objects.filter(product=product).delete()
-                ProductImage.objects.create(product=product, image_url=image_url)
-                product.image_upload_status = "completed"
-                product.save()
-                logger.info(
-                    f"Synchronous upload succeeded for product {product_id}: {image_url}"
+                urls = future.result()
+            except ImageRejectedError as exc:
+                # 다시 보내도 거절되므로 재시도하지 않고 이 이미지만 제외
+                logger.warning(
+                    f"Image rejected for product {product_id} ({group[0][0]}): {str(exc)}"
                 )
-            except Exception as sync_exc:
+                for temp_file_path, _ in group:
+                    uploaded[temp_file_path] = None
+                    _remove_temp_file(temp_file_path)
+                continue
+            except Exception as exc:
                 logger.error(
-                    f"Synchronous upload failed for product {product_id}: {str(sync_exc)}"
+                    f"Image upload failed for product {product_id} ({group[0][0]}): {str(exc)}"
                 )
-                product = Product.objects.get(id=product_id)
-                product.image_upload_status = "failed"
-                ProductImage.objects.filter(product=product).delete()
-                ProductImage.objects.create(
-                    product=product, image_url="https://picsum.photos/1000"
+                errors.append(exc)
+                continue
+            for temp_file_path, _ in group:
+                uploaded[temp_file_path] = urls
+                _remove_temp_file(temp_file_path)
+            if content_hash:
+                image_url, thumbnail_url = urls
+                assets.append(
+                    ImageAsset(
+                        content_hash=content_hash,
+                        image_url=image_url,
+                        thumbnail_url=thumbnail_url,
+                    )
                 )
-                product.save()
-                logger.warning(f"Set default image for product {product_id}")
+    # 재시도하더라도 이미 올린 이미지는 다른 상품이 재사용할 수 있도록 바로 기록
+    ImageAsset.objects.bulk_create(assets, ignore_conflicts=True)
+
+    if errors and self.request.retries < self.max_retries:
+        countdown = get_exponential_backoff_interval(
+            IMAGE_UPLOAD_BACKOFF,
+            self.request.retries,
+            IMAGE_UPLOAD_BACKOFF_MAX,
+            full_jitter=True,
+        )
+        retry_after = max(
+            (exc.retry_after for exc in errors if isinstance(exc, CircuitOpenError)),
+            default=0,
+        )
+        # 서킷이 열려 있으면 닫힐 때까지 업로드를 시도하지 않고 대기
+        countdown = max(countdown, math.ceil(retry_after))
+        logger.info(
+            f"Retrying {len(errors)} image uploads for product {product_id} in {countdown}s"
+        )
+        raise self.retry(
+            args=(product_id, files),
+            kwargs={"uploaded": uploaded},
+            countdown=countdown,
+            exc=errors[0],
+        )
+
+    # 요청에 담긴 순서대로 저장하고, 하나도 올리지 못했으면 기본 이미지를 사용
+    # (uploaded의 None은 이미지 서비스가 거절한 이미지)
+    rejected = sum(1 for urls in uploaded.values() if urls is None)
+    image_urls = [
+        uploaded[temp_file_path]
+        for temp_file_path, *_ in files
+        if uploaded.get(temp_file_path)
+    ] or [[DEFAULT_IMAGE_URL, None]]
+    with transaction.atomic():
+        # 같은 작업이 동시에 두 번 실행되어도 상태를 먼저 바꾼 쪽만 이미지를 저장
+        updated = Product.objects.filter(
+            id=product_id, image_upload_status="pending"
+        ).update(image_upload_status="failed" if errors or rejected else "completed")
+        if updated:
+            ProductImage.objects.bulk_create(
+                [
+                    ProductImage(
+                        product_id=product_id,
+                        image_url=image_url,
+                        thumbnail_url=thumbnail_url,
+                    )
+                    for image_url, thumbnail_url in image_urls
+                ]
+            )
+    for temp_file_path, *_ in files:
+        _remove_temp_file(temp_file_path)
+    if not updated:
+        logger.info(f"Images for product {product_id} were saved by another run")
+        return 0
+    if errors or rejected:
+        logger.warning(
+            f"Failed to upload {len(errors) + rejected} images for product {product_id}"
+        )
+    logger.info(f"Saved {len(image_urls)} images for product {product_id}")
+    return len(image_urls)
+
+
+@shared_task
+def upload_image_to_cloudflare_task(temp_file_path, product_id, content_type=None):
+    """이전 버전에서 이미지마다 발행된 작업용. 묶음 업로드 작업으로 넘김"""
+    upload_product_images_task.delay(product_id, [[temp_file_path, content_type]])
+
+
+def _movement_totals(records):
+    """상품별 입출고 합계 (입고 +, 출고 -)"""
+    return dict(
+        records.values("product")
+        .annotate(
+            pieces=Sum(
+                ProductRecord.movement_pieces_expression(F("product__pieces_per_box"))
+            )
+        )
+        .values_list("product", "pieces")
+    )
+
+
+@shared_task(acks_late=True)
+def create_daily_stock_snapshots(snapshot_date=None):
+    """
+    snapshot_date(기본: 어제) 마감 재고를 직전 스냅샷 + 이후 입출고로 계산해 저장합니다.
+    이미 스냅샷이 있는 상품은 건너뛰므로 다시 실행해도 안전합니다.
+    """
+    if snapshot_date:
+        snapshot_date = date.fromisoformat(snapshot_date)
+    else:
+        snapshot_date = timezone.localdate() - timedelta(days=1)
+    day_start = start_of_local_day(snapshot_date)
+    day_end = start_of_local_day(snapshot_date + timedelta(days=1))
+
+    previous = ProductStockSnapshot.objects.filter(
+        product=OuterRef("pk"), snapshot_date__lt=snapshot_date
+    ).order_by("-snapshot_date")
+    products = (
+        Product.objects.filter(created_at__lt=day_end)
+        .exclude(stock_snapshots__snapshot_date=snapshot_date)
+        .annotate(
+            previous_date=Subquery(previous.values("snapshot_date")[:1]),
+            previous_stock=Subquery(previous.values("stock_pieces")[:1]),
+        )
+        .values_list("pk", "created_at", "previous_date", "previous_stock")
+    )
+
+    # 당일 입출고는 전 상품을 한 번에 집계
+    daily_totals = _movement_totals(
+        ProductRecord.objects.filter(
+            record_date__gte=day_start, record_date__lt=day_end
+        )
+    )
+
+    snapshots = []
+    gaps = {}
+    for product_id, created_at, previous_date, previous_stock in products:
+        if previous_date == snapshot_date - timedelta(days=1):
+            stock = previous_stock + daily_totals.get(product_id, 0)
+        elif previous_date is None and created_at >= day_start:
+            # 당일 생성된 상품은 이전 입출고가 없음
+            stock = daily_totals.get(product_id, 0)
         else:
-            logger.info(f"Retrying image upload task for product {product_id}")
-            self.retry(countdown=60, exc=exc)
-    finally:
-        if self.request.retries >= self.max_retries and os.path.exists(temp_file_path):
-            try:
-                os.remove(temp_file_path)
-                logger.info(f"Temporary file {temp_file_path} deleted")
-            except Exception as e:
-                logger.error(
-                    f"Failed to delete temporary file {temp_file_path}: {str(e)}"
+            gaps.setdefault(previous_date, []).append((product_id, previous_stock))
+            continue
+        snapshots.append(
+            ProductStockSnapshot(
+                product_id=product_id,
+                snapshot_date=snapshot_date,
+                stock_pieces=stock,
+            )
+        )
+
+    # 직전 스냅샷이 없거나 며칠 빠진 상품만 빠진 구간을 추가로 집계
+    for previous_date, items in gaps.items():
+        records = ProductRecord.objects.filter(
+            product_id__in=[product_id for product_id, _ in items],
+            record_date__lt=day_start,
+        )
+        if previous_date is not None:
+            records = records.filter(
+                record_date__gte=start_of_local_day(previous_date + timedelta(days=1))
+            )
+        gap_totals = _movement_totals(records)
+        for product_id, previous_stock in items:
+            stock = (
+                (previous_stock or 0)
+                + gap_totals.get(product_id, 0)
+                + daily_totals.get(product_id, 0)
+            )
+            snapshots.append(
+                ProductStockSnapshot(
+                    product_id=product_id,
+                    snapshot_date=snapshot_date,
+                    stock_pieces=stock,
                 )
+            )
+
+    ProductStockSnapshot.objects.bulk_create(
+        snapshots, batch_size=1000, ignore_conflicts=True
+    )
+    logger.info(f"Created {len(snapshots)} stock snapshots for {snapshot_date}")
+    return len(snapshots)
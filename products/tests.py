@@ -1,3 +1,1225 @@
-from django.test import TestCase
+import csv
+import hashlib
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures.process import BrokenProcessPool
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+import requests
+from PIL import Image
+from django.contrib import admin
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection, transaction
+from django.db.models import QuerySet
+from django.http import StreamingHttpResponse
+from django.test import (
+    SimpleTestCase,
+    TestCase,
+    RequestFactory,
+    TransactionTestCase,
+    override_settings,
+    skipUnlessDBFeature,
+)
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.exceptions import APIException
+from rest_framework.test import APIClient
+from companies.models import Company, CompanyMembership
+from users.models import User
+from .admin import ProductRecordAdmin
+from .images import get_process_pool, process_image
+from .models import (
+    ImageAsset,
+    Product,
+    ProductImage,
+    ProductRecord,
+    ProductStockSnapshot,
+    start_of_local_day,
+)
+from .services import (
+    CircuitOpenError,
+    ImageRejectedError,
+    image_service_breaker,
+    upload_image_to_cloudflare,
+)
+from .tasks import (
+    create_daily_stock_snapshots,
+    upload_image_to_cloudflare_task,
+    upload_product_images_task,
+)
 
-# Create your tests here.
+
+class ConsumeStockTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="tester")
+        self.company = Company.objects.create(name="ocelot", owner=self.user)
+
+    def create_product(self, **kwargs):
+        return Product.objects.create(
+            name="상품", category="food", company=self.company, **kwargs
+        )
+
+    def stock_in(self, product, box_quantity=0, piece_quantity=0):
+        record = ProductRecord(
+            product=product,
+            record_type="in",
+            box_quantity=box_quantity,
+            piece_quantity=piece_quantity,
+        )
+        record.save()
+        return record
+
+    def stock_out(self, product, box_quantity=0, piece_quantity=0):
+        record = ProductRecord(
+            product=product,
+            record_type="out",
+            box_quantity=box_quantity,
+            piece_quantity=piece_quantity,
+        )
+        record.save()
+        return record
+
+    def test_consumes_oldest_lots_first(self):
+        product = self.create_product(pieces_per_box=10)
+        first = self.stock_in(product, box_quantity=1)
+        second = self.stock_in(product, piece_quantity=5)
+        third = self.stock_in(product, box_quantity=1)
+
+        self.stock_out(product, box_quantity=1, piece_quantity=2)
+
+        first.refresh_from_db()
+        second.refresh_from_db()
+        third.refresh_from_db()
+        self.assertEqual(first.consumed_quantity, 10)
+        self.assertEqual(second.consumed_quantity, 2)
+        self.assertEqual(third.consumed_quantity, 0)
+        product.refresh_from_db()
+        self.assertEqual(product.stock_pieces, 13)
+        self.assertEqual(product.get_ledger_stock(), 13)
+
+    def test_insufficient_stock_leaves_lots_untouched(self):
+        product = self.create_product(pieces_per_box=10)
+        lot = self.stock_in(product, piece_quantity=5)
+
+        with self.assertRaisesMessage(ValueError, "소진할 재고가 부족합니다."):
+            self.stock_out(product, piece_quantity=6)
+
+        lot.refresh_from_db()
+        self.assertEqual(lot.consumed_quantity, 0)
+        self.assertFalse(product.records.filter(record_type="out").exists())
+        product.refresh_from_db()
+        self.assertEqual(product.stock_pieces, 5)
+
+    def test_query_count_does_not_depend_on_lot_count(self):
+        single_lot = self.create_product(pieces_per_box=10)
+        self.stock_in(single_lot, box_quantity=3)
+        many_lots = self.create_product(pieces_per_box=10)
+        for _ in range(30):
+            self.stock_in(many_lots, box_quantity=1)
+
+        with CaptureQueriesContext(connection) as single_lot_queries:
+            self.stock_out(single_lot, box_quantity=3)
+        with CaptureQueriesContext(connection) as many_lot_queries:
+            self.stock_out(many_lots, box_quantity=30)
+
+        self.assertEqual(len(single_lot_queries), len(many_lot_queries))
+        self.assertEqual(many_lots.records.filter(consumed_quantity=10).count(), 30)
+
+
+class StockCounterTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="tester", is_staff=True)
+        self.company = Company.objects.create(name="ocelot", owner=self.user)
+        self.product = Product.objects.create(
+            name="상품", category="food", company=self.company, pieces_per_box=10
+        )
+        self.lot = ProductRecord(product=self.product, record_type="in", box_quantity=2)
+        self.lot.save()
+
+    def assert_stock(self, pieces):
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock_pieces, pieces)
+        self.assertEqual(self.product.get_ledger_stock(), pieces)
+
+    def test_updating_a_lot_rebuilds_counter(self):
+        self.lot.box_quantity = 3
+        self.lot.save()
+
+        self.assert_stock(30)
+
+    def test_deleting_a_lot_rebuilds_counter(self):
+        self.lot.delete()
+
+        self.assert_stock(0)
+
+    def test_queryset_delete_rebuilds_counter(self):
+        ProductRecord.objects.filter(pk=self.lot.pk).delete()
+
+        self.assert_stock(0)
+
+    def test_admin_delete_selected_rebuilds_counter(self):
+        model_admin = ProductRecordAdmin(ProductRecord, admin.site)
+        request = RequestFactory().post("/admin/")
+        request.user = self.user
+
+        model_admin.delete_queryset(request, ProductRecord.objects.all())
+
+        self.assert_stock(0)
+
+    def test_rebuild_stock_command_reports_and_repairs_drift(self):
+        Product.objects.filter(pk=self.product.pk).update(stock_pieces=0)
+        ProductRecord.objects.filter(pk=self.lot.pk).update(remaining_pieces=0)
+
+        with self.assertRaisesMessage(CommandError, "불일치 상품 1개"):
+            call_command("rebuild_stock", "--check", stdout=io.StringIO())
+        call_command("rebuild_stock", stdout=io.StringIO())
+
+        self.assert_stock(20)
+        self.lot.refresh_from_db()
+        self.assertEqual(self.lot.remaining_pieces, 20)
+        call_command("rebuild_stock", "--check", stdout=io.StringIO())
+
+
+class ProductListTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="tester")
+        self.company = Company.objects.create(name="ocelot", owner=self.user)
+        self.other_company = Company.objects.create(name="other", owner=self.user)
+        # save()의 알림 작업 발행을 피하기 위해 bulk_create 사용
+        CompanyMembership.objects.bulk_create(
+            [CompanyMembership(company=self.company, user=self.user, role="owner")]
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_products(self, count, company=None, category="food"):
+        products = Product.objects.bulk_create(
+            [
+                Product(
+                    name=f"상품 {index}",
+                    category=category,
+                    company=company or self.company,
+                    stock_pieces=25,
+                )
+                for index in range(count)
+            ]
+        )
+        ProductImage.objects.bulk_create(
+            [
+                ProductImage(product=product, image_url="https://example.com/1.jpg")
+                for product in products
+            ]
+        )
+        return products
+
+    def test_lists_only_products_of_member_companies(self):
+        self.create_products(2)
+        self.create_products(3, company=self.other_company)
+
+        response = self.client.get("/api/v1/products/")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["count"], 2)
+        self.assertEqual(
+            response.data["results"][0]["current_stock"],
+            {"box_quantity": 1, "piece_quantity": 5, "total_pieces": 25},
+        )
+        self.assertEqual(
+            response.data["results"][0]["image_urls"], ["https://example.com/1.jpg"]
+        )
+
+    def test_filters_by_category(self):
+        self.create_products(2, category="food")
+        self.create_products(1, category="pharma")
+
+        response = self.client.get("/api/v1/products/", {"category": "pharma"})
+
+        self.assertEqual(response.data["count"], 1)
+
+    def test_query_count_does_not_depend_on_page_size(self):
+        self.create_products(30)
+
+        with CaptureQueriesContext(connection) as small_page:
+            self.client.get("/api/v1/products/", {"page_size": 2})
+        with CaptureQueriesContext(connection) as large_page:
+            self.client.get("/api/v1/products/", {"page_size": 30})
+
+        self.assertEqual(len(small_page), len(large_page))
+
+
+class ProductRecordBulkTests(TestCase):
+    url = "/api/v1/products/records/bulk/"
+
+    def setUp(self):
+        self.user = User.objects.create(username="tester")
+        self.company = Company.objects.create(name="ocelot", owner=self.user)
+        # save()의 알림 작업 발행을 피하기 위해 bulk_create 사용
+        CompanyMembership.objects.bulk_create(
+            [CompanyMembership(company=self.company, user=self.user, role="employee")]
+        )
+        outsider = User.objects.create(username="outsider")
+        other_company = Company.objects.create(name="other", owner=outsider)
+        self.product, self.other_product = Product.objects.bulk_create(
+            [
+                Product(
+                    name="상품", category="food", company=company, pieces_per_box=10
+                )
+                for company in (self.company, other_company)
+            ]
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_creates_rows_from_json(self):
+        response = self.client.post(
+            self.url,
+            [
+                {"product": self.product.id, "record_type": "in", "box_quantity": 2},
+                {"product": self.product.id, "record_type": "out", "piece_quantity": 5},
+            ],
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            [result["status"] for result in response.data["results"]],
+            ["created", "created"],
+        )
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock_pieces, 15)
+        self.assertTrue(
+            self.product.records.filter(recorded_by=self.user, record_type="out")
+        )
+
+    def test_creates_rows_from_csv_body_and_file(self):
+        content = (
+            "product,record_type,box_quantity,piece_quantity\n"
+            f"{self.product.id},in,1,\n"
+        )
+
+        body_response = self.client.post(
+            self.url, content.encode(), content_type="text/csv"
+        )
+        file_response = self.client.post(
+            self.url,
+            {"file": io.BytesIO(("\ufeff" + content).encode())},
+            format="multipart",
+        )
+
+        self.assertEqual(body_response.status_code, 201)
+        self.assertEqual(file_response.status_code, 201)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock_pieces, 20)
+
+    def test_insufficient_stock_fails_only_that_row(self):
+        response = self.client.post(
+            self.url,
+            [
+                {"product": self.product.id, "record_type": "in", "piece_quantity": 3},
+                {"product": self.product.id, "record_type": "out", "piece_quantity": 5},
+            ],
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual(
+            [result["status"] for result in response.data["results"]],
+            ["created", "failed"],
+        )
+        self.assertFalse(self.product.records.filter(record_type="out").exists())
+
+    def test_rejects_products_of_other_companies(self):
+        response = self.client.post(
+            self.url,
+            [
+                {"product": self.product.id, "record_type": "in", "box_quantity": 1},
+                {"product": self.other_product.id, "record_type": "in"},
+            ],
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("product", response.data[1])
+        self.assertFalse(ProductRecord.objects.exists())
+
+    def test_rejects_more_than_max_rows(self):
+        rows = [{"product": self.product.id, "record_type": "in"}] * 1001
+
+        response = self.client.post(self.url, rows, format="json")
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(ProductRecord.objects.exists())
+
+
+class ProductRecordListTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="tester")
+        self.company = Company.objects.create(name="ocelot", owner=self.user)
+        self.product = Product.objects.bulk_create(
+            [Product(name="상품", category="food", company=self.company)]
+        )[0]
+        self.url = f"/api/v1/products/{self.product.id}/records/"
+        now = timezone.now()
+        records = ProductRecord.objects.bulk_create(
+            [
+                ProductRecord(product=self.product, record_type="in", box_quantity=1)
+                for _ in range(5)
+            ]
+        )
+        # 두 기록은 같은 시각이라 id로 순서를 정함
+        for record, days_ago in zip(records, [3, 1, 1, 2, 0]):
+            ProductRecord.objects.filter(id=record.id).update(
+                record_date=now - timedelta(days=days_ago)
+            )
+        self.expected_ids = [
+            records[4].id,
+            records[2].id,
+            records[1].id,
+            records[3].id,
+            records[0].id,
+        ]
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_cursor_pages_follow_record_date_then_id(self):
+        response = self.client.get(self.url, {"page_size": 2})
+        self.assertNotIn("count", response.data)
+        self.assertIsNone(response.data["previous"])
+
+        ids = []
+        while True:
+            ids += [record["id"] for record in response.data["results"]]
+            if not response.data["next"]:
+                break
+            response = self.client.get(response.data["next"])
+
+        self.assertEqual(ids, self.expected_ids)
+
+    def test_page_number_pagination_on_request(self):
+        response = self.client.get(self.url, {"pagination": "page", "page_size": 2})
+
+        self.assertEqual(response.data["count"], 5)
+        self.assertEqual(
+            [record["id"] for record in response.data["results"]],
+            self.expected_ids[:2],
+        )
+
+    def test_page_parameter_falls_back_to_page_numbers(self):
+        response = self.client.get(self.url, {"page": 2, "page_size": 2})
+
+        self.assertEqual(response.data["count"], 5)
+        self.assertEqual(
+            [record["id"] for record in response.data["results"]],
+            self.expected_ids[2:4],
+        )
+
+
+class ExpiringLotListTests(TestCase):
+    url = "/api/v1/products/expiring/"
+
+    def setUp(self):
+        self.user = User.objects.create(username="tester")
+        self.company = Company.objects.create(name="ocelot", owner=self.user)
+        other_company = Company.objects.create(
+            name="other", owner=User.objects.create(username="outsider")
+        )
+        self.product, self.other_product = Product.objects.bulk_create(
+            [
+                Product(
+                    name="상품", category="food", company=company, pieces_per_box=10
+                )
+                for company in (self.company, other_company)
+            ]
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_lot(self, days_left, product=None):
+        record = ProductRecord(
+            product=product or self.product, record_type="in", box_quantity=1
+        )
+        record.save()
+        ProductRecord.objects.filter(id=record.id).update(
+            expiration_date=timezone.now() + timedelta(days=days_left)
+        )
+        return record
+
+    def lot_ids(self, **params):
+        response = self.client.get(self.url, {"company": self.company.id, **params})
+        self.assertEqual(response.status_code, 200)
+        return [lot["id"] for lot in response.data["results"]]
+
+    def test_lists_remaining_lots_expiring_within_days(self):
+        later = self.create_lot(5)
+        sooner = self.create_lot(2)
+        self.create_lot(10)
+        self.create_lot(-1)
+        self.create_lot(2, product=self.other_product)
+
+        self.assertEqual(self.lot_ids(), [sooner.id, later.id])
+        self.assertEqual(self.lot_ids(days=3), [sooner.id])
+
+    def test_excludes_used_up_lots(self):
+        used_up = self.create_lot(2)
+        self.create_lot(3)
+        # 먼저 입고된 기록부터 소진
+        ProductRecord(product=self.product, record_type="out", piece_quantity=10).save()
+
+        response = self.client.get(self.url, {"company": self.company.id})
+
+        self.assertNotIn(used_up.id, [lot["id"] for lot in response.data["results"]])
+        self.assertEqual(response.data["results"][0]["remaining_pieces"], 10)
+        self.assertEqual(response.data["results"][0]["product_name"], "상품")
+
+    def test_rejects_invalid_days(self):
+        for days in ["abc", "0", "366"]:
+            response = self.client.get(
+                self.url, {"company": self.company.id, "days": days}
+            )
+            self.assertEqual(response.status_code, 400)
+
+    def test_rejects_non_members(self):
+        self.client.force_authenticate(User.objects.create(username="stranger"))
+
+        response = self.client.get(self.url, {"company": self.company.id})
+
+        self.assertEqual(response.status_code, 403)
+
+
+class ProductRecordExportTests(TestCase):
+    url = "/api/v1/products/records/export/"
+
+    def setUp(self):
+        self.user = User.objects.create(username="tester")
+        self.company = Company.objects.create(name="ocelot", owner=self.user)
+        other_company = Company.objects.create(
+            name="other", owner=User.objects.create(username="outsider")
+        )
+        self.product, self.other_product = Product.objects.bulk_create(
+            [
+                Product(
+                    name="상품", category="food", company=company, pieces_per_box=10
+                )
+                for company in (self.company, other_company)
+            ]
+        )
+        now = timezone.now()
+        self.old = self.record(self.product, "in", now - timedelta(days=10))
+        self.recent = self.record(self.product, "in", now - timedelta(days=2))
+        self.record(self.other_product, "in", now - timedelta(days=2))
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def record(self, product, record_type, record_date):
+        record = ProductRecord(
+            product=product,
+            record_type=record_type,
+            box_quantity=1,
+            recorded_by=self.user,
+        )
+        record.save()
+        ProductRecord.objects.filter(id=record.id).update(record_date=record_date)
+        return record
+
+    def export(self, **params):
+        response = self.client.get(self.url, {"company": self.company.id, **params})
+        self.assertEqual(response.status_code, 200)
+        self.assertIsInstance(response, StreamingHttpResponse)
+        return b"".join(response.streaming_content).decode()
+
+    def test_streams_company_records_as_csv(self):
+        rows = list(csv.reader(io.StringIO(self.export())))
+
+        self.assertEqual(
+            rows[0][:4], ["id", "product_id", "product_name", "record_type"]
+        )
+        # 다른 회사의 기록은 제외하고 기록 시각 순서대로
+        self.assertEqual(
+            [row[0] for row in rows[1:]], [str(self.old.id), str(self.recent.id)]
+        )
+        self.assertEqual(rows[1][2:4], ["상품", "in"])
+        self.assertEqual(rows[1][8], "tester")
+
+    def test_streams_ndjson(self):
+        lines = self.export(output="ndjson").splitlines()
+
+        records = [json.loads(line) for line in lines]
+        self.assertEqual(
+            [record["id"] for record in records], [self.old.id, self.recent.id]
+        )
+        self.assertEqual(records[0]["product_name"], "상품")
+        self.assertEqual(records[0]["remaining_pieces"], 10)
+
+    def test_filters_by_record_date_range(self):
+        start_date = (timezone.now() - timedelta(days=5)).isoformat()
+
+        end_date = (timezone.now() - timedelta(days=5)).isoformat()
+
+        after = list(csv.reader(io.StringIO(self.export(start_date=start_date))))
+        before = list(csv.reader(io.StringIO(self.export(end_date=end_date))))
+
+        self.assertEqual([row[0] for row in after[1:]], [str(self.recent.id)])
+        self.assertEqual([row[0] for row in before[1:]], [str(self.old.id)])
+
+    def test_reads_rows_in_chunks(self):
+        with mock.patch.object(
+            QuerySet, "iterator", autospec=True, side_effect=QuerySet.iterator
+        ) as iterator:
+            self.export()
+
+        self.assertEqual(iterator.call_args.kwargs, {"chunk_size": 2000})
+
+    def test_rejects_non_members(self):
+        self.client.force_authenticate(User.objects.create(username="stranger"))
+
+        response = self.client.get(self.url, {"company": self.company.id})
+
+        self.assertEqual(response.status_code, 403)
+
+
+class StockSnapshotTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="tester")
+        self.company = Company.objects.create(name="ocelot", owner=self.user)
+        self.snapshot_date = timezone.localdate() - timedelta(days=1)
+        self.day_start = start_of_local_day(self.snapshot_date)
+
+    def create_product(self, created_at):
+        product = Product.objects.create(
+            name="상품", category="food", company=self.company, pieces_per_box=10
+        )
+        Product.objects.filter(id=product.id).update(created_at=created_at)
+        return product
+
+    def record(self, product, record_type, piece_quantity, record_date):
+        record = ProductRecord(
+            product=product, record_type=record_type, piece_quantity=piece_quantity
+        )
+        record.save()
+        ProductRecord.objects.filter(id=record.id).update(record_date=record_date)
+
+    def test_adds_daily_movements_to_previous_snapshot(self):
+        product = self.create_product(self.day_start - timedelta(days=3))
+        self.record(product, "in", 7, self.day_start - timedelta(days=2))
+        ProductStockSnapshot.objects.create(
+            product=product,
+            snapshot_date=self.snapshot_date - timedelta(days=1),
+            stock_pieces=50,
+        )
+        self.record(product, "in", 5, self.day_start + timedelta(hours=9))
+
+        with CaptureQueriesContext(connection) as queries:
+            create_daily_stock_snapshots(self.snapshot_date.isoformat())
+
+        # 직전 스냅샷을 그대로 이어 쓰고 이전 기록은 다시 읽지 않음
+        self.assertEqual(
+            product.stock_snapshots.get(snapshot_date=self.snapshot_date).stock_pieces,
+            55,
+        )
+        self.assertEqual(len(queries), 3)
+
+    def test_aggregates_gap_only_for_products_without_recent_snapshot(self):
+        old_product = self.create_product(self.day_start - timedelta(days=5))
+        self.record(old_product, "in", 20, self.day_start - timedelta(days=4))
+        self.record(old_product, "out", 3, self.day_start - timedelta(days=2))
+        self.record(old_product, "in", 4, self.day_start + timedelta(hours=9))
+        new_product = self.create_product(self.day_start + timedelta(hours=8))
+        self.record(new_product, "in", 6, self.day_start + timedelta(hours=9))
+
+        with CaptureQueriesContext(connection) as queries:
+            create_daily_stock_snapshots(self.snapshot_date.isoformat())
+
+        stocks = dict(
+            ProductStockSnapshot.objects.filter(
+                snapshot_date=self.snapshot_date
+            ).values_list("product", "stock_pieces")
+        )
+        self.assertEqual(stocks, {old_product.id: 21, new_product.id: 6})
+        # 빠진 구간 집계는 해당 상품만 대상으로 함
+        gap_queries = [
+            q["sql"]
+            for q in queries
+            if "GROUP BY" in q["sql"] and 'record_date" >=' not in q["sql"]
+        ]
+        self.assertEqual(len(gap_queries), 1)
+        self.assertIn(f"IN ({old_product.id})", gap_queries[0])
+
+    def test_stock_at_uses_nearest_snapshot_and_later_records(self):
+        product = self.create_product(self.day_start - timedelta(days=3))
+        self.record(product, "in", 30, self.day_start - timedelta(days=2))
+        ProductStockSnapshot.objects.create(
+            product=product,
+            snapshot_date=self.snapshot_date - timedelta(days=1),
+            stock_pieces=40,
+        )
+        self.record(product, "in", 5, self.day_start + timedelta(hours=9))
+        self.record(product, "out", 2, self.day_start + timedelta(hours=12))
+
+        stock = product.get_stock_at(self.day_start + timedelta(hours=10))
+
+        self.assertEqual(stock["total_pieces"], 45)
+        self.assertEqual(stock["snapshot_date"], self.snapshot_date - timedelta(days=1))
+        self.assertEqual(
+            product.get_stock_at(self.day_start - timedelta(days=1))["total_pieces"], 30
+        )
+
+
+@skipUnlessDBFeature("has_select_for_update")
+class ConcurrentConsumeStockTests(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="tester")
+        self.company = Company.objects.create(name="ocelot", owner=self.user)
+
+    def create_product(self):
+        # bulk_create로 생성해 알림 작업 기록을 건너뜀
+        return Product.objects.bulk_create(
+            [
+                Product(
+                    name="상품",
+                    category="food",
+                    company=self.company,
+                    pieces_per_box=10,
+                )
+            ]
+        )[0]
+
+    def run_in_threads(self, target, count):
+        def worker():
+            try:
+                target()
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def test_concurrent_stock_out_never_over_consumes(self):
+        product = self.create_product()
+        for _ in range(5):
+            ProductRecord(product=product, record_type="in", box_quantity=1).save()
+
+        results = []
+        barrier = threading.Barrier(20)
+
+        def stock_out():
+            barrier.wait()
+            try:
+                ProductRecord(
+                    product_id=product.id, record_type="out", piece_quantity=3
+                ).save()
+                results.append("ok")
+            except ValueError:
+                results.append("insufficient")
+
+        self.run_in_threads(stock_out, 20)
+
+        # 50개 재고에서 3개씩 출고하면 16건만 성공해야 함
+        self.assertEqual(results.count("ok"), 16)
+        self.assertEqual(results.count("insufficient"), 4)
+        lots = product.records.filter(record_type="in")
+        self.assertTrue(all(lot.consumed_quantity <= 10 for lot in lots))
+        self.assertEqual(sum(lot.consumed_quantity for lot in lots), 48)
+        product.refresh_from_db()
+        self.assertEqual(product.stock_pieces, 2)
+        self.assertEqual(product.get_ledger_stock(), 2)
+
+    def test_stock_outs_inserted_before_locking_do_not_deadlock(self):
+        product = self.create_product()
+        ProductRecord(product=product, record_type="in", box_quantity=1).save()
+
+        # 두 출고가 모두 기록을 INSERT(상품 행 FOR KEY SHARE)한 뒤에 상품을 잠그도록 맞춤
+        inserted = threading.Barrier(2)
+        consume_stock = ProductRecord._consume_stock
+
+        def consume_after_both_inserted(record):
+            inserted.wait(timeout=5)
+            return consume_stock(record)
+
+        results = []
+
+        def stock_out():
+            try:
+                with transaction.atomic():
+                    # 외래 키 검사를 INSERT 시점에 하도록 해 FOR KEY SHARE를 바로 잡음
+                    with connection.cursor() as cursor:
+                        cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+                    ProductRecord(
+                        product_id=product.id, record_type="out", piece_quantity=3
+                    ).save()
+                results.append("ok")
+            except Exception as e:
+                results.append(type(e).__name__)
+
+        with mock.patch.object(
+            ProductRecord, "_consume_stock", consume_after_both_inserted
+        ):
+            self.run_in_threads(stock_out, 2)
+
+        self.assertEqual(results, ["ok", "ok"])
+        product.refresh_from_db()
+        self.assertEqual(product.stock_pieces, 4)
+
+    def test_stock_out_on_other_product_is_not_blocked(self):
+        locked_product = self.create_product()
+        other_product = self.create_product()
+        ProductRecord(product=other_product, record_type="in", box_quantity=1).save()
+
+        locked = threading.Event()
+        release = threading.Event()
+        finished = threading.Event()
+
+        def hold_lock():
+            with transaction.atomic():
+                Product.objects.select_for_update().get(pk=locked_product.pk)
+                locked.set()
+                release.wait(timeout=10)
+
+        def stock_out_other():
+            locked.wait(timeout=10)
+            ProductRecord(
+                product_id=other_product.id, record_type="out", piece_quantity=1
+            ).save()
+            finished.set()
+
+        threads = [
+            threading.Thread(target=self.run_in_threads, args=(hold_lock, 1)),
+            threading.Thread(target=self.run_in_threads, args=(stock_out_other, 1)),
+        ]
+        for thread in threads:
+            thread.start()
+        try:
+            # 다른 상품의 잠금이 풀리기 전에 출고가 끝나야 함
+            self.assertTrue(finished.wait(timeout=5))
+        finally:
+            release.set()
+            for thread in threads:
+                thread.join()
+
+
+def create_photo(width=4000, height=3000, orientation=6):
+    """EXIF 방향 값이 있는 JPEG 임시 파일 (6: 시계 방향 90도 회전해서 봐야 함)"""
+    image = Image.new("RGB", (width, height), "orange")
+    exif = image.getexif()
+    exif[0x0112] = orientation
+    with tempfile.NamedTemporaryFile(delete=False, suffix=".jpg") as temp_file:
+        image.save(temp_file, "JPEG", exif=exif)
+    return temp_file.name
+
+
+class FakeImageServiceHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        service = self.server
+        service.uploads.append(
+            {
+                "client_port": self.client_address[1],
+                "content_type": self.headers["Content-Type"],
+                "body": body,
+            }
+        )
+        time.sleep(service.delay)
+        status = service.status
+        if service.fail_marker and service.fail_marker in body:
+            status = service.fail_status
+        if status == 200:
+            payload = {"success": True, "result": {"id": f"img-{len(service.uploads)}"}}
+        else:
+            payload = {"success": False, "errors": [{"message": "upstream error"}]}
+        content = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeImageService(ThreadingHTTPServer):
+    """Cloudflare Images 업로드 API를 흉내 내는 로컬 서버"""
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), FakeImageServiceHandler)
+        self.uploads = []
+        self.delay = 0
+        self.status = 200
+        # 본문에 이 값이 들어 있는 업로드는 fail_status로 응답
+        self.fail_marker = None
+        self.fail_status = 400
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_port}/images/v1"
+
+    def handle_error(self, request, client_address):
+        # 시간 초과로 클라이언트가 먼저 끊은 연결은 무시
+        pass
+
+
+class FakeImageServiceMixin:
+    def start_fake_image_service(self):
+        service = FakeImageService()
+        threading.Thread(target=service.serve_forever, daemon=True).start()
+        self.addCleanup(service.server_close)
+        self.addCleanup(service.shutdown)
+        settings_override = override_settings(
+            CLOUDFLARE_IMAGES_URL=service.url,
+            CLOUDFLARE_API_TOKEN="token",
+            CLOUDFLARE_ACCOUNT_HASH="hash",
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        return service
+
+
+class UploadImageToCloudflareTests(FakeImageServiceMixin, SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.service = self.start_fake_image_service()
+
+    def test_streams_multipart_body_and_reuses_connection(self):
+        content = b"\xff\xd8" + b"x" * 100_000
+
+        urls = [
+            upload_image_to_cloudflare(io.BytesIO(content), content_type="image/png")
+            for _ in range(3)
+        ]
+
+        self.assertEqual(urls[0], "https://imagedelivery.net/hash/img-1/public")
+        upload = self.service.uploads[0]
+        boundary = upload["content_type"].split("boundary=")[1]
+        self.assertTrue(upload["content_type"].startswith("multipart/form-data"))
+        self.assertIn(b"Content-Type: image/png\r\n\r\n" + content, upload["body"])
+        self.assertTrue(upload["body"].endswith(f"--{boundary}--\r\n".encode()))
+        # keep-alive로 같은 연결을 재사용
+        self.assertEqual(
+            len({upload["client_port"] for upload in self.service.uploads}), 1
+        )
+
+    @override_settings(CLOUDFLARE_READ_TIMEOUT=0.2)
+    def test_hung_upstream_times_out(self):
+        self.service.delay = 1
+
+        with self.assertRaises(requests.exceptions.ReadTimeout):
+            upload_image_to_cloudflare(io.BytesIO(b"image"))
+
+
+class ImageServiceCircuitBreakerTests(FakeImageServiceMixin, SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.service = self.start_fake_image_service()
+
+    def test_opens_after_consecutive_failures_and_fails_fast(self):
+        self.service.status = 503
+        for _ in range(5):
+            with self.assertRaises(APIException):
+                upload_image_to_cloudflare(io.BytesIO(b"image"))
+
+        with self.assertRaises(CircuitOpenError):
+            upload_image_to_cloudflare(io.BytesIO(b"image"))
+
+        self.assertEqual(len(self.service.uploads), 5)
+        self.assertEqual(image_service_breaker.get_state()["state"], "open")
+
+    def test_client_errors_do_not_open_circuit(self):
+        self.service.status = 400
+        for _ in range(6):
+            with self.assertRaises(ImageRejectedError):
+                upload_image_to_cloudflare(io.BytesIO(b"image"))
+
+        self.assertEqual(image_service_breaker.get_state()["state"], "closed")
+
+    def test_rate_limit_is_retryable(self):
+        self.service.status = 429
+
+        with self.assertRaises(APIException) as context:
+            upload_image_to_cloudflare(io.BytesIO(b"image"))
+
+        self.assertNotIsInstance(context.exception, ImageRejectedError)
+
+    def test_open_circuit_reports_remaining_time(self):
+        # 1초 뒤 시험 요청이 가능해지는 열린 서킷
+        cache.set("circuit:cloudflare_images:opened_at", time.time() - 59)
+
+        with self.assertRaises(CircuitOpenError) as context:
+            upload_image_to_cloudflare(io.BytesIO(b"image"))
+
+        self.assertLessEqual(context.exception.retry_after, 1)
+        self.assertEqual(self.service.uploads, [])
+
+    def test_failed_trial_request_reopens_circuit(self):
+        cache.set("circuit:cloudflare_images:opened_at", time.time() - 61)
+        self.service.status = 503
+
+        with self.assertRaises(APIException):
+            upload_image_to_cloudflare(io.BytesIO(b"image"))
+
+        state = image_service_breaker.get_state()
+        self.assertEqual(state["state"], "open")
+        self.assertGreater(state["retry_after"], 59)
+        with self.assertRaises(CircuitOpenError):
+            upload_image_to_cloudflare(io.BytesIO(b"image"))
+        self.assertEqual(len(self.service.uploads), 1)
+
+    def test_successful_trial_request_closes_circuit(self):
+        # reset_timeout(60초)이 지난 열린 서킷
+        cache.set("circuit:cloudflare_images:opened_at", time.time() - 61)
+        self.assertEqual(image_service_breaker.get_state()["state"], "half_open")
+
+        upload_image_to_cloudflare(io.BytesIO(b"image"))
+
+        self.assertEqual(image_service_breaker.get_state()["state"], "closed")
+
+
+@override_settings(IMAGE_PROCESS_WORKERS=0)
+class UploadImageTaskTests(FakeImageServiceMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.service = self.start_fake_image_service()
+        self.user = User.objects.create(username="tester")
+        self.company = Company.objects.create(name="ocelot", owner=self.user)
+        self.product = Product.objects.create(
+            name="상품", category="food", company=self.company
+        )
+
+    def create_temp_file(self, content=b"image"):
+        with tempfile.NamedTemporaryFile(delete=False, suffix=".jpg") as temp_file:
+            temp_file.write(content)
+        self.addCleanup(
+            lambda: os.path.exists(temp_file.name) and os.remove(temp_file.name)
+        )
+        return [temp_file.name, "image/jpeg"]
+
+    def test_keeps_every_image_with_one_bulk_insert(self):
+        files = [self.create_temp_file(f"image {i}".encode()) for i in range(3)]
+
+        with CaptureQueriesContext(connection) as queries:
+            upload_product_images_task.apply((self.product.id, files))
+
+        self.assertEqual(len(self.service.uploads), 3)
+        self.assertEqual(self.product.images.count(), 3)
+        inserts = [
+            q
+            for q in queries
+            if q["sql"].startswith('INSERT INTO "products_productimage"')
+        ]
+        self.assertEqual(len(inserts), 1)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.image_upload_status, "completed")
+        self.assertFalse(any(os.path.exists(path) for path, _ in files))
+
+    def test_uploads_normalized_image_and_thumbnail(self):
+        photo_path = create_photo()
+
+        upload_product_images_task.apply((self.product.id, [[photo_path, None]]))
+
+        self.assertEqual(len(self.service.uploads), 2)
+        self.assertTrue(
+            all(b"Content-Type: image/webp" in u["body"] for u in self.service.uploads)
+        )
+        image = self.product.images.get()
+        self.assertIsNotNone(image.thumbnail_url)
+        self.assertNotEqual(image.thumbnail_url, image.image_url)
+        self.assertFalse(os.path.exists(photo_path))
+
+    def test_redelivered_task_does_not_duplicate_images(self):
+        files = [self.create_temp_file(f"image {i}".encode()) for i in range(2)]
+
+        upload_product_images_task.apply((self.product.id, files))
+        upload_product_images_task.apply((self.product.id, files))
+
+        self.assertEqual(len(self.service.uploads), 2)
+        self.assertEqual(self.product.images.count(), 2)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.image_upload_status, "completed")
+
+    def test_reuses_previously_uploaded_image(self):
+        content_hash = hashlib.sha256(b"package photo").hexdigest()
+        other_product = Product.objects.create(
+            name="다른 상품", category="food", company=self.company
+        )
+        upload_product_images_task.apply(
+            (
+                self.product.id,
+                [self.create_temp_file(b"package photo") + [content_hash]],
+            )
+        )
+
+        files = [self.create_temp_file(b"package photo") + [content_hash]]
+        upload_product_images_task.apply((other_product.id, files))
+
+        self.assertEqual(len(self.service.uploads), 1)
+        self.assertEqual(
+            other_product.images.get().image_url, self.product.images.get().image_url
+        )
+        self.assertEqual(ImageAsset.objects.get().content_hash, content_hash)
+        self.assertFalse(os.path.exists(files[0][0]))
+
+    def test_hashes_files_of_tasks_queued_without_hash(self):
+        files = [self.create_temp_file(b"legacy photo")]
+
+        upload_product_images_task.apply((self.product.id, files))
+
+        self.assertEqual(
+            ImageAsset.objects.get().content_hash,
+            hashlib.sha256(b"legacy photo").hexdigest(),
+        )
+
+    def test_uploads_duplicate_images_in_one_request_once(self):
+        files = [self.create_temp_file(b"same") for _ in range(3)]
+
+        upload_product_images_task.apply((self.product.id, files))
+
+        self.assertEqual(len(self.service.uploads), 1)
+        self.assertEqual(
+            set(self.product.images.values_list("image_url", flat=True)),
+            {"https://imagedelivery.net/hash/img-1/public"},
+        )
+        self.assertEqual(self.product.images.count(), 3)
+
+    @mock.patch.object(image_service_breaker, "failure_threshold", 100)
+    def test_retries_only_failed_images(self):
+        files = [self.create_temp_file(b"good"), self.create_temp_file(b"bad")]
+        self.service.fail_marker = b"bad"
+        self.service.fail_status = 503
+
+        upload_product_images_task.apply((self.product.id, files))
+
+        bodies = [upload["body"] for upload in self.service.uploads]
+        self.assertEqual(sum(b"good" in body for body in bodies), 1)
+        self.assertEqual(sum(b"bad" in body for body in bodies), 7)
+        # 올린 이미지는 남기고 상태만 실패로 표시
+        self.assertEqual(self.product.images.count(), 1)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.image_upload_status, "failed")
+        self.assertFalse(any(os.path.exists(path) for path, _ in files))
+
+    def test_rejected_image_is_not_retried(self):
+        files = [self.create_temp_file(b"good"), self.create_temp_file(b"bad")]
+        self.service.fail_marker = b"bad"
+
+        with self.assertLogs("products.tasks", "INFO") as logs:
+            upload_product_images_task.apply((self.product.id, files))
+
+        bodies = [upload["body"] for upload in self.service.uploads]
+        self.assertEqual(sum(b"bad" in body for body in bodies), 1)
+        self.assertFalse(any("Retrying" in line for line in logs.output))
+        # 거절된 이미지만 빼고 저장
+        self.assertEqual(self.product.images.count(), 1)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.image_upload_status, "failed")
+        self.assertFalse(any(os.path.exists(path) for path, _ in files))
+
+    def test_open_circuit_parks_task_without_calling_upstream(self):
+        cache.set("circuit:cloudflare_images:opened_at", time.time())
+        files = [self.create_temp_file()]
+
+        with self.assertLogs("products.tasks", "INFO") as logs:
+            upload_product_images_task.apply((self.product.id, files))
+
+        self.assertEqual(self.service.uploads, [])
+        # 서킷이 닫힐 때까지(60초) 기다렸다가 재시도
+        countdowns = [
+            int(line.rsplit(" in ", 1)[1].rstrip("s"))
+            for line in logs.output
+            if "Retrying" in line
+        ]
+        self.assertEqual(len(countdowns), 6)
+        self.assertTrue(all(countdown >= 60 for countdown in countdowns))
+        self.assertEqual(
+            list(self.product.images.values_list("image_url", flat=True)),
+            ["https://picsum.photos/1000"],
+        )
+
+    @mock.patch("products.tasks.upload_product_images_task.delay")
+    def test_legacy_single_image_task_delegates(self, delay):
+        upload_image_to_cloudflare_task("/tmp/image.jpg", self.product.id, "image/png")
+
+        delay.assert_called_once_with(
+            self.product.id, [["/tmp/image.jpg", "image/png"]]
+        )
+
+
+class ProcessImageTests(SimpleTestCase):
+    def setUp(self):
+        self.photo_path = create_photo()
+        self.addCleanup(os.remove, self.photo_path)
+
+    def assert_normalized(self, result):
+        image_path, content_type, thumbnail_path = result
+        self.addCleanup(os.remove, image_path)
+        self.addCleanup(os.remove, thumbnail_path)
+        self.assertEqual(content_type, "image/webp")
+        with Image.open(image_path) as image:
+            self.assertEqual(image.format, "WEBP")
+            # EXIF 방향이 적용되어 세로 사진이 됨
+            self.assertEqual(image.size, (1536, 2048))
+        with Image.open(thumbnail_path) as thumbnail:
+            self.assertEqual(thumbnail.size, (240, 320))
+
+    @override_settings(IMAGE_PROCESS_WORKERS=0)
+    def test_normalizes_inline(self):
+        self.assert_normalized(process_image(self.photo_path))
+
+    @override_settings(IMAGE_PROCESS_WORKERS=1)
+    def test_normalizes_in_process_pool(self):
+        self.assert_normalized(process_image(self.photo_path))
+
+    @override_settings(IMAGE_PROCESS_WORKERS=1)
+    @mock.patch("products.images._pool", None)
+    @mock.patch("products.images.ProcessPoolExecutor")
+    def test_threads_share_one_process_pool(self, executor):
+        executor.side_effect = lambda **kwargs: time.sleep(0.05) or mock.Mock()
+        pools = []
+        barrier = threading.Barrier(8)
+
+        def worker():
+            barrier.wait()
+            pools.append(get_process_pool())
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        executor.assert_called_once()
+        self.assertEqual(len(set(map(id, pools))), 1)
+
+    @override_settings(IMAGE_PROCESS_WORKERS=1)
+    @mock.patch("products.images._pool_pid", os.getpid())
+    @mock.patch("products.images._pool")
+    @mock.patch("products.images.ProcessPoolExecutor")
+    def test_broken_pool_is_shut_down_and_replaced(self, executor, broken_pool):
+        broken_pool.submit.return_value.result.side_effect = BrokenProcessPool()
+
+        self.assert_normalized(process_image(self.photo_path))
+
+        broken_pool.shutdown.assert_called_once_with(wait=False, cancel_futures=True)
+        self.assertIs(get_process_pool(), executor.return_value)
+
+    @override_settings(IMAGE_PROCESS_WORKERS=0)
+    def test_keeps_original_when_not_an_image(self):
+        with tempfile.NamedTemporaryFile(delete=False, suffix=".jpg") as temp_file:
+            temp_file.write(b"not an image")
+        self.addCleanup(os.remove, temp_file.name)
+
+        self.assertEqual(process_image(temp_file.name), (temp_file.name, None, None))
@@ -3,8 +3,25 @@ from . import views
 
 urlpatterns = [
     path("", views.ProductView.as_view(), name="product"),
+    path("expiring/", views.ExpiringLotListView.as_view(), name="product_expiring"),
+    path(
+        "image-service/",
+        views.ImageServiceStatusView.as_view(),
+        name="product_image_service",
+    ),
+    path(
+        "records/export/",
+        views.ProductRecordExportView.as_view(),
+        name="product_record_export",
+    ),
+    path(
+        "records/bulk/",
+        views.ProductRecordBulkView.as_view(),
+        name="product_record_bulk",
+    ),
     path("<int:pk>/", views.ProductDetailView.as_view(), name="product_detail"),
     path("<int:pk>/qr/", views.get_product_qr, name="product_qr"),
+    path("<int:pk>/stock/", views.ProductStockAtView.as_view(), name="product_stock"),
     path(
         "<int:pk>/records/",
         views.ProductRecordListView.as_view(),
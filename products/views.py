@@ -1,27 +1,72 @@
+import csv
+import json
 import qrcode
 import base64
+from datetime import datetime, timedelta
 from io import BytesIO
+from django.db.models import Q
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.utils import timezone
 from rest_framework.exceptions import ValidationError
 from rest_framework.fields import parse_datetime
-from rest_framework.generics import ListCreateAPIView
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.generics import ListAPIView, ListCreateAPIView
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+from rest_framework.parsers import JSONParser, MultiPartParser
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.decorators import api_view
+from companies.models import Company
+from companies.permissions import IsCompanyMember
 from products.models import Product, ProductRecord
+from .parsers import CSVParser, parse_csv
+from .services import image_service_breaker
 from .serializers import (
+    ExpiringLotSerializer,
+    ProductRecordBulkItemSerializer,
     ProductRecordSerializer,
     ProductSerializer,
 )
 
+BULK_RECORD_MAX_ROWS = 1000
+
+
+class ProductPagination(PageNumberPagination):
+    page_size = 20
+    page_size_query_param = "page_size"
+    max_page_size = 100
+
 
 class ProductView(APIView):
+    """
+    기능 : 내가 속한 회사의 상품 목록을 조회(?company=, ?category=)하거나 상품을 등록합니다.
+    허용 : 로그인한 사용자
+    """
+
     def get(self, request):
-        products = Product.objects.all()
-        serializer = ProductSerializer(products, many=True)
-        return Response(serializer.data)
+        # 재고는 상품의 카운터 컬럼에서 읽고 이미지는 한 번에 가져와 쿼리 수를 고정
+        products = (
+            Product.objects.filter(company__members=request.user)
+            .prefetch_related("images")
+            .order_by("-id")
+        )
+        company = request.query_params.get("company")
+        if company:
+            if not company.isdigit():
+                raise ValidationError({"company": "유효하지 않은 회사 ID입니다."})
+            products = products.filter(company_id=company)
+        category = request.query_params.get("category")
+        if category:
+            if category not in dict(Product.CATEGORY_CHOICES):
+                raise ValidationError({"category": "유효하지 않은 카테고리입니다."})
+            products = products.filter(category=category)
+
+        paginator = ProductPagination()
+        page = paginator.paginate_queryset(products, request, view=self)
+        serializer = ProductSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
 
     def post(self, request):
         serializer = ProductSerializer(data=request.data)
@@ -68,6 +113,109 @@ class ProductRecordCreateView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+class ProductRecordBulkView(APIView):
+    """
+    기능 : 여러 상품의 입출고 기록을 한 번에 등록합니다. (JSON 배열 또는 CSV)
+    허용 : 로그인한 사용자 (소속 회사의 상품만)
+    """
+
+    parser_classes = [JSONParser, CSVParser, MultiPartParser]
+
+    def get_rows(self, request):
+        csv_file = request.FILES.get("file")
+        if csv_file:
+            return parse_csv(csv_file.read())
+        return request.data
+
+    def get_products(self, rows):
+        product_ids = set()
+        if isinstance(rows, list):
+            for row in rows:
+                try:
+                    product_ids.add(int(row.get("product")))
+                except (AttributeError, TypeError, ValueError):
+                    continue
+        return Product.objects.in_bulk(product_ids)
+
+    def get_member_company_ids(self, user, products):
+        """요청한 상품들의 회사 중 사용자가 소속(직원 또는 사장)된 회사 ID"""
+        return set(
+            Company.objects.filter(
+                Q(members=user) | Q(owner=user),
+                id__in={product.company_id for product in products.values()},
+            ).values_list("id", flat=True)
+        )
+
+    def post(self, request):
+        rows = self.get_rows(request)
+        products = self.get_products(rows)
+        serializer = ProductRecordBulkItemSerializer(
+            data=rows,
+            many=True,
+            allow_empty=False,
+            max_length=BULK_RECORD_MAX_ROWS,
+            context={
+                "products": products,
+                "company_ids": self.get_member_company_ids(request.user, products),
+            },
+        )
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        results = []
+        for row, (record, error) in enumerate(
+            serializer.save(recorded_by=request.user)
+        ):
+            if error:
+                results.append({"row": row, "status": "failed", "error": error})
+            else:
+                results.append({"row": row, "status": "created", "id": record.id})
+
+        has_failure = any(result["status"] == "failed" for result in results)
+        return Response(
+            {"results": results},
+            status=(
+                status.HTTP_207_MULTI_STATUS if has_failure else status.HTTP_201_CREATED
+            ),
+        )
+
+
+class ProductStockAtView(APIView):
+    """
+    기능 : ?at= 시점의 재고를 일자별 스냅샷과 이후 입출고 기록으로 계산합니다.
+    허용 : 로그인한 사용자
+    """
+
+    def get(self, request, pk):
+        product = get_object_or_404(Product, pk=pk)
+        at = request.query_params.get("at")
+        if not at:
+            raise ValidationError({"at": "조회할 시점을 입력해주세요."})
+        try:
+            at = parse_datetime(at)
+        except ValueError:
+            at = None
+        if not at:
+            raise ValidationError(
+                {"at": "맞지 않은 날짜 형식입니다. ISO 8601 형식을 사용하십시오."}
+            )
+        if timezone.is_naive(at):
+            at = timezone.make_aware(at)
+        return Response({"at": at, **product.get_stock_at(at)})
+
+
+class ImageServiceStatusView(APIView):
+    """
+    기능 : 이미지 업로드 서비스 서킷 브레이커 상태(closed/open/half_open)를 조회합니다.
+    허용 : 관리자
+    """
+
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(image_service_breaker.get_state())
+
+
 def generate_qr_code(url):
     qr = qrcode.QRCode(version=1, box_size=10, border=5)
     qr.add_data(url)
@@ -87,72 +235,77 @@ def get_product_qr(request, pk):
     return Response({"qr_code": qr_image})
 
 
+def parse_record_date(value):
+    if not value:
+        return None
+    try:
+        parsed = parse_datetime(value)
+    except ValueError:
+        parsed = None
+    if not parsed:
+        raise ValidationError(
+            "맞지 않은 날짜 형식입니다. YYYY-MM-DD 형식을 사용하십시오."
+        )
+    return parsed
+
+
+def get_record_date_range(query_params):
+    """start_date/end_date 쿼리 파라미터를 검증해 (시작 시각, 종료일 끝 시각)으로 반환"""
+    start_date = parse_record_date(query_params.get("start_date"))
+    end_date = parse_record_date(query_params.get("end_date"))
+    if start_date and end_date and start_date > end_date:
+        raise ValidationError("시작일은 종료일보다 늦을 수 없습니다.")
+    if end_date:
+        # 종료일 포함 (하루 끝까지)
+        end_date = end_date.replace(hour=23, minute=59, second=59, microsecond=999999)
+    return start_date, end_date
+
+
 class ProductRecordPagination(PageNumberPagination):
     page_size = 10
     page_size_query_param = "page_size"
     max_page_size = 100
 
 
+class ProductRecordCursorPagination(CursorPagination):
+    page_size = 10
+    page_size_query_param = "page_size"
+    max_page_size = 100
+    ordering = ("-record_date", "-id")
+
+
 class ProductRecordListView(ListCreateAPIView):
+    """
+    기본은 커서 기반 페이지네이션이며, ?pagination=page 또는 ?page=N 으로
+    기존 페이지 번호 방식을 사용할 수 있습니다.
+    """
+
     serializer_class = ProductRecordSerializer
-    pagination_class = ProductRecordPagination
+    pagination_class = ProductRecordCursorPagination
+
+    @property
+    def paginator(self):
+        if not hasattr(self, "_paginator"):
+            query_params = self.request.query_params
+            if query_params.get("pagination") == "page" or "page" in query_params:
+                self._paginator = ProductRecordPagination()
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
 
     def get_queryset(self):
         product_id = self.kwargs["pk"]
         queryset = ProductRecord.objects.filter(product_id=product_id).order_by(
-            "-record_date"
+            "-record_date", "-id"
         )
         record_type = self.request.query_params.get("record_type")
         if record_type in ["in", "out"]:
             queryset = queryset.filter(record_type=record_type)
 
-        start_date = self.request.query_params.get("start_date")
-        end_date = self.request.query_params.get("end_date")
-
-        if start_date and end_date:
-            try:
-                start_date = parse_datetime(start_date)
-                end_date = parse_datetime(end_date)
-                if not start_date or not end_date:
-                    raise ValidationError(
-                        "맞지 않은 날짜 형식입니다. YYYY-MM-DD 형식을 사용하십시오."
-                    )
-                if start_date > end_date:
-                    raise ValidationError("시작일은 종료일보다 늦을 수 없습니다.")
-            except ValueError:
-                raise ValidationError(
-                    "맞지 않은 날짜 형식입니다. YYYY-MM-DD 형식을 사용하십시오."
-                )
-        elif start_date:
-            try:
-                start_date = parse_datetime(start_date)
-                if not start_date:
-                    raise ValidationError(
-                        "맞지 않은 날짜 형식입니다. YYYY-MM-DD 형식을 사용하십시오."
-                    )
-            except ValueError:
-                raise ValidationError(
-                    "맞지 않은 날짜 형식입니다. YYYY-MM-DD 형식을 사용하십시오."
-                )
-        elif end_date:
-            try:
-                end_date = parse_datetime(end_date)
-                if not end_date:
-                    raise ValidationError(
-                        "맞지 않은 날짜 형식입니다. YYYY-MM-DD 형식을 사용하십시오."
-                    )
-            except ValueError:
-                raise ValidationError(
-                    "맞지 않은 날짜 형식입니다. YYYY-MM-DD 형식을 사용하십시오."
-                )
-
+        start_date, end_date = get_record_date_range(self.request.query_params)
         if start_date:
             queryset = queryset.filter(record_date__gte=start_date)
         if end_date:
-            # 종료일 포함 (하루 끝까지)
-            end_date = end_date.replace(
-                hour=23, minute=59, second=59, microsecond=999999
-            )
             queryset = queryset.filter(record_date__lte=end_date)
 
         return queryset.select_related("product", "recorded_by")
@@ -169,3 +322,128 @@ class ProductRecordListView(ListCreateAPIView):
             serializer.save()
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+class ExpiringLotListView(ListAPIView):
+    """
+    기능 : 회사의 남은 재고 중 ?days=N(기본 7)일 안에 유통기한이 끝나는 입고 기록을 조회합니다.
+    허용 : 회사 멤버
+    """
+
+    serializer_class = ExpiringLotSerializer
+    permission_classes = [IsAuthenticated, IsCompanyMember]
+    pagination_class = ProductRecordPagination
+
+    def get_queryset(self):
+        company_id = self.request.query_params.get("company", "")
+        if not company_id.isdigit():
+            raise ValidationError({"company": "회사 ID를 입력해주세요."})
+        company = get_object_or_404(Company, pk=company_id)
+        self.check_object_permissions(self.request, company)
+        try:
+            days = int(self.request.query_params.get("days", 7))
+        except ValueError:
+            raise ValidationError({"days": "일 수는 정수여야 합니다."})
+        if not 1 <= days <= 365:
+            raise ValidationError({"days": "일 수는 1에서 365 사이여야 합니다."})
+
+        now = timezone.now()
+        return (
+            ProductRecord.objects.filter(
+                product__company=company,
+                record_type="in",
+                remaining_pieces__gt=0,
+                expiration_date__gte=now,
+                expiration_date__lt=now + timedelta(days=days),
+            )
+            .select_related("product")
+            .order_by("expiration_date", "id")
+        )
+
+
+class Echo:
+    """csv.writer가 쓴 한 줄을 그대로 돌려주는 버퍼"""
+
+    def write(self, value):
+        return value
+
+
+class ProductRecordExportView(APIView):
+    """
+    기능 : 회사의 입출고 기록을 CSV(기본) 또는 NDJSON(?output=ndjson)으로 스트리밍합니다.
+          ?product=, ?start_date=, ?end_date= 로 범위를 좁힐 수 있습니다.
+    허용 : 회사 멤버
+    """
+
+    permission_classes = [IsAuthenticated, IsCompanyMember]
+    chunk_size = 2000
+    columns = [
+        ("id", "id"),
+        ("product_id", "product_id"),
+        ("product_name", "product__name"),
+        ("record_type", "record_type"),
+        ("box_quantity", "box_quantity"),
+        ("piece_quantity", "piece_quantity"),
+        ("consumed_quantity", "consumed_quantity"),
+        ("remaining_pieces", "remaining_pieces"),
+        ("recorded_by", "recorded_by__username"),
+        ("record_date", "record_date"),
+        ("expiration_date", "expiration_date"),
+    ]
+
+    def get(self, request):
+        company_id = request.query_params.get("company", "")
+        if not company_id.isdigit():
+            raise ValidationError({"company": "회사 ID를 입력해주세요."})
+        company = get_object_or_404(Company, pk=company_id)
+        self.check_object_permissions(request, company)
+
+        output = request.query_params.get("output", "csv")
+        if output not in ("csv", "ndjson"):
+            raise ValidationError({"output": "csv 또는 ndjson만 지원합니다."})
+
+        queryset = ProductRecord.objects.filter(product__company=company)
+        product_id = request.query_params.get("product")
+        if product_id:
+            if not product_id.isdigit():
+                raise ValidationError({"product": "유효하지 않은 상품 ID입니다."})
+            queryset = queryset.filter(product_id=product_id)
+        start_date, end_date = get_record_date_range(request.query_params)
+        if start_date:
+            queryset = queryset.filter(record_date__gte=start_date)
+        if end_date:
+            queryset = queryset.filter(record_date__lte=end_date)
+
+        # 서버 측 커서로 chunk_size씩 읽어 내보내므로 전체 건수와 관계없이 메모리 사용량이 일정
+        rows = (
+            queryset.order_by("record_date", "id")
+            .values_list(*[field for _, field in self.columns])
+            .iterator(chunk_size=self.chunk_size)
+        )
+        if output == "ndjson":
+            content, content_type = self.stream_ndjson(rows), "application/x-ndjson"
+        else:
+            content, content_type = self.stream_csv(rows), "text/csv; charset=utf-8"
+
+        response = StreamingHttpResponse(content, content_type=content_type)
+        response["Content-Disposition"] = (
+            f'attachment; filename="product-records-{company.id}.{output}"'
+        )
+        return response
+
+    def format_value(self, value):
+        if isinstance(value, datetime):
+            return timezone.localtime(value).isoformat()
+        return value
+
+    def stream_csv(self, rows):
+        writer = csv.writer(Echo())
+        yield writer.writerow([name for name, _ in self.columns])
+        for row in rows:
+            yield writer.writerow([self.format_value(value) for value in row])
+
+    def stream_ndjson(self, rows):
+        names = [name for name, _ in self.columns]
+        for row in rows:
+            record = dict(zip(names, (self.format_value(value) for value in row)))
+            yield json.dumps(record, ensure_ascii=False) + "\n"